@@ -0,0 +1,141 @@
+"""
+Load test of check-ins during a rush: hundreds of users (some tapping twice)
+check in to one open event at once, on as many threads as the dispatcher
+has workers. Compares the check-in before the event-state cache and check-in
+index (three sequential remote calls per check-in, copied below as it was)
+with `router.event.event_checkin` as it is now, both against the same
+simulated remote bases.
+
+Reported: time until each user gets the reply, remote calls per check-in
+(the aggregate counters, updated by the attendance writer as check-ins are
+flushed, are counted separately) and the number of records written, which
+must equal the number of users.
+
+Usage: python bench/checkin_load.py [users] [double taps]
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime as dt
+import statistics
+import tempfile
+import common
+import random
+import time
+import sys
+import os
+
+from db.sqlite import SqliteStore
+from db import CachedBase, CheckinIndex, AttendanceWriter, AttendanceAggregates, threaded_repository
+from dispatcher import DISPATCH_WORKERS
+from utils import EventInfo
+import router.event
+
+ev = sys.modules["router.event"]
+user_module = sys.modules["router.user"]
+CODE = "abacus"
+
+
+class Bases:
+    """Fresh simulated remote bases, seeded with an open event and its users."""
+
+    def __init__(self, user_ids: list):
+        self.store = SqliteStore(os.path.join(tempfile.mkdtemp(prefix="momentum-bench-"), "bench.db"))
+        self.remote = {}
+        self.open("events").put({"name": "Rush", "open": True}, CODE)
+        self.open("users").put_many([{"key": u, "name": u} for u in user_ids])
+        for base in self.remote.values():
+            base.calls.clear()
+
+    def open(self, name: str):
+        if name not in self.remote:
+            self.remote[name] = common.RemoteBase(self.store.base(name))
+        return self.remote[name]
+
+    def calls(self, *names) -> int:
+        return sum(self.remote[name].total_calls for name in names if name in self.remote)
+
+
+class Replies:
+    def __init__(self):
+        self.at = {}
+
+    def __call__(self, event, **kwargs):
+        self.at.setdefault(event.user, time.perf_counter())
+
+
+def legacy_checkin(bases: Bases, replies: Replies, event: EventInfo, code: str):
+    events, records = bases.open("events"), bases.open("records")
+    user_id = event.user
+    event_info_momentum = events.get(code)
+    if event_info_momentum == None or not event_info_momentum.get('open', False):
+        return
+    if records.get(f"{code}{user_id}"):
+        replies(event)
+        return
+    if not bases.open("users").get(user_id):
+        return
+    records.put({"user": user_id, "event": code, "time": dt.now().timestamp()}, f"{code}{user_id}")
+    replies(event)
+
+
+def install(bases: Bases, replies: Replies) -> AttendanceWriter:
+    """
+    Point the check-in handler at the simulated bases, with the users cache
+    warmed as on startup and the event cache and check-in index cold.
+    """
+    ev.events = CachedBase(bases.open("events"), ttl=60)
+    ev.users = user_module.users = CachedBase(bases.open("users"), ttl=600)
+    ev.users.warm()
+    bases.open("users").calls.clear()
+    ev.records = bases.open("records")
+    ev.repo = threaded_repository(bases.open)
+    ev.checkins = CheckinIndex()
+    aggregates = AttendanceAggregates(bases.open("attendance-stats"))
+    ev.attendance = AttendanceWriter(ev.records, os.path.join(tempfile.mkdtemp(prefix="momentum-bench-"), "journal"))
+    ev.attendance.on_flush(lambda items: aggregates.record_checkins(
+        items, {item["user"]: ev.users.get(item["user"])["name"] for item in items}))
+    ev.attendance.start()
+    ev.send_message = replies
+    return ev.attendance
+
+
+def rush(handler, taps: list) -> dict:
+    submitted = {}
+    with ThreadPoolExecutor(DISPATCH_WORKERS) as pool:
+        for user_id in taps:
+            submitted.setdefault(user_id, time.perf_counter())
+            pool.submit(handler, EventInfo(text=f"event checkin {CODE}", channel="D1", user=user_id), CODE)
+    return submitted
+
+
+def report(name: str, submitted: dict, replies: Replies, bases: Bases, checkins: int) -> list:
+    waits = sorted(replies.at[u] - submitted[u] for u in submitted if u in replies.at)
+    records = sum(1 for _ in bases.store.base("records").fetch(limit=100000).items)
+    return [name, len(waits), common.fmt_time(statistics.median(waits)),
+            common.fmt_time(waits[int(len(waits) * 0.99) - 1]),
+            f"{bases.calls('events', 'records', 'users') / checkins:.2f}",
+            f"{bases.calls('attendance-stats') / checkins:.2f}", records]
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    doubles = int(sys.argv[2]) if len(sys.argv) > 2 else n // 3
+    user_ids = [f"U{i:05d}" for i in range(n)]
+    rng = random.Random(0)
+    taps = user_ids + rng.sample(user_ids, doubles)
+    rng.shuffle(taps)
+    print(f"{n} users, {len(taps)} check-ins to one event on {DISPATCH_WORKERS} workers, "
+          f"{common.REMOTE_LATENCY * 1000:.0f} ms per remote call\n")
+
+    rows = []
+    bases, replies = Bases(user_ids), Replies()
+    submitted = rush(lambda event, code: legacy_checkin(bases, replies, event, code), taps)
+    rows.append(report("before", submitted, replies, bases, len(taps)))
+
+    bases, replies = Bases(user_ids), Replies()
+    writer = install(bases, replies)
+    submitted = rush(ev.event_checkin, taps)
+    writer.close()
+    rows.append(report("event cache + check-in index", submitted, replies, bases, len(taps)))
+
+    common.table(["check-in", "replies", "reply (p50)", "reply (p99)",
+                  "remote calls / check-in", "aggregate calls / check-in", "records"], rows)
@@ -0,0 +1,72 @@
+"""
+Microbenchmark of event code allocation: reading `codes.txt` and picking a
+random line on every create (as `event_create` did, copied below) against
+`router.codes.CodeAllocator`, for events bases with more and more codes in
+use.
+
+Reported: the allocator's startup cost (reading the word list, then loading
+the used codes from the simulated remote events base on first use), the
+time per allocation for both, and how often the old way picks a code that
+is already taken, which made `events.insert` fail.
+
+Usage: python bench/code_alloc.py [allocations]
+"""
+import random
+import common
+import time
+import sys
+
+from router.codes import CodeAllocator, CODES_FILE
+
+
+def legacy_code() -> str:
+    with open(CODES_FILE) as f:
+        codes = f.readlines()
+        code = random.choice(codes).strip()
+    return code
+
+
+if __name__ == "__main__":
+    allocations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with open(CODES_FILE) as f:
+        words = [line.strip() for line in f if line.strip()]
+    print(f"{len(words)} words, {allocations} allocations, "
+          f"{common.REMOTE_LATENCY * 1000:.0f} ms per remote call\n")
+
+    rows = []
+    for share in (0, 0.5, 0.9, 1.0):
+        base = common.sqlite_base("events")
+        used = random.Random(0).sample(words, int(len(words) * share))
+        base.put_many([{"key": code, "name": code, "open": False} for code in used])
+        used = set(used)
+        remote = common.RemoteBase(base)
+
+        legacy_collisions = 0
+        for _ in range(allocations):
+            legacy_collisions += legacy_code() in used
+        legacy_time = common.per_call(lambda _: legacy_code(), range(allocations))
+
+        start = time.perf_counter()
+        allocator = CodeAllocator(remote)
+        read = time.perf_counter() - start
+        start = time.perf_counter()
+        allocator.allocate() # loads the used codes
+        load = time.perf_counter() - start
+        # restart from the same state for each pass, without the startup cost
+        free, taken = list(allocator._free), set(allocator._used)
+
+        def allocate_all():
+            allocator._free, allocator._used = list(free), set(taken)
+            for _ in range(allocations):
+                allocator.allocate()
+        new_time = common.timed(allocate_all, repeat=5)[1] / allocations
+        allocator._free, allocator._used = list(free), set(taken)
+        codes = [allocator.allocate() for _ in range(allocations)]
+        new_collisions = sum(code in used for code in codes) + allocations - len(set(codes))
+
+        rows.append([f"{share:.0%}", common.fmt_time(read), common.fmt_time(load),
+                     common.fmt_time(legacy_time), common.fmt_time(new_time),
+                     f"{legacy_collisions / allocations:.1%}", f"{new_collisions / allocations:.1%}"])
+
+    common.table(["codes in use", "startup: word list", "startup: used codes", "old / allocation",
+                  "new / allocation", "old collisions", "new collisions"], rows)
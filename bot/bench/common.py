@@ -0,0 +1,100 @@
+"""
+Shared setup for the benchmarks in this directory. Run them from `bot/`
+with plain python, e.g. `python bench/parse_fuzz.py`; they never touch Deta
+or Slack. Importing this module puts `bot/` on the path and points the bot at
+a throwaway SQLite file, so it must be imported before any bot module.
+"""
+from threading import Lock
+import statistics
+import tempfile
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", os.path.join(tempfile.mkdtemp(prefix="momentum-bench-"), "bench.db"))
+os.environ.setdefault("ATTENDANCE_JOURNAL", os.path.join(tempfile.mkdtemp(prefix="momentum-bench-"), "journal"))
+
+# round trip of a Deta Base call, as seen from the bot's host
+REMOTE_LATENCY = float(os.getenv("BENCH_REMOTE_LATENCY", 0.02))
+
+
+class RemoteBase:
+    """
+    Wraps a Base to behave like a remote one: every call sleeps for
+    `latency` seconds and is counted per method.
+    Args:
+        base: the Base to wrap, e.g. a SqliteBase
+        latency (float): seconds added to every call
+    """
+
+    def __init__(self, base, latency: float = REMOTE_LATENCY):
+        self.base = base
+        self.latency = latency
+        self.calls = {}
+        self._lock = Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self.base, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self._lock:
+                self.calls[name] = self.calls.get(name, 0) + 1
+            if self.latency:
+                time.sleep(self.latency)
+            return attr(*args, **kwargs)
+        return call
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+
+def sqlite_base(name: str):
+    """A fresh, empty SQLite-backed Base in a temporary file."""
+    from db.sqlite import SqliteStore
+    return SqliteStore(os.path.join(tempfile.mkdtemp(prefix="momentum-bench-"), "bench.db")).base(name)
+
+
+def timed(fn, *args, repeat: int = 1, **kwargs) -> tuple:
+    """
+    Run a function `repeat` times.
+    Returns:
+        tuple: (result of the last run, median seconds per run)
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times)
+
+
+def per_call(fn, inputs, repeat: int = 5) -> float:
+    """Median over `repeat` passes of the mean seconds per `fn(x)` for x in inputs."""
+    def run():
+        for x in inputs:
+            fn(x)
+    return timed(run, repeat=repeat)[1] / len(inputs)
+
+
+def fmt_time(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.2f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+
+def table(headers: list, rows: list):
+    """Print rows as an aligned plain-text table."""
+    rows = [[str(cell) for cell in row] for row in rows]
+    widths = [max([len(str(h))] + [len(row[i]) for row in rows]) for i, h in enumerate(headers)]
+    print("  ".join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in rows:
+        print("  ".join(cell.ljust(w) for cell, w in zip(row, widths)))
+    print()
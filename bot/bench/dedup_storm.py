@@ -0,0 +1,114 @@
+"""
+Simulates Slack retry storms against the /slack endpoint to measure the
+redundant work the event deduplicator removes. Every event is delivered once
+plus up to three retries (with the X-Slack-Retry-Num header), shuffled so
+retries arrive while the original is still being handled. The router is
+replaced by a check-in-like handler that makes three calls to a simulated
+remote Base and one simulated Slack call.
+
+Compared: no deduplication (as before, when retries were never detected),
+the in-memory deduplicator, and the deduplicator with a shared (remote)
+backend, whose own calls are counted as DB work too.
+
+Usage: python bench/dedup_storm.py [events] [seed]
+"""
+import common
+import contextlib
+import random
+import time
+import sys
+import io
+import os
+
+os.environ.setdefault("DISPATCH_QUEUE_SIZE", "100000")
+
+from fastapi.testclient import TestClient
+from dedup import EventDeduplicator
+import main
+
+MAX_RETRIES = 3
+
+
+class NoDedup:
+    def seen(self, event_id: str) -> bool:
+        return False
+
+    def forget(self, event_id: str):
+        pass
+
+    def metrics(self) -> dict:
+        return {}
+
+
+class Workload:
+    """Stands in for the router: three Base calls and one Slack call per event."""
+
+    def __init__(self):
+        self.base = common.RemoteBase(common.sqlite_base("records"))
+        self.slack_calls = 0
+        self.handled = 0
+
+    def __call__(self, event):
+        self.base.get(event.user)
+        self.base.get(event.text)
+        self.base.put({"user": event.user, "event": event.text}, f"{event.text}{event.user}")
+        time.sleep(common.REMOTE_LATENCY)
+        self.slack_calls += 1
+        self.handled += 1
+
+
+def deliveries(n: int, seed: int) -> list:
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        body = {"type": "event_callback", "event_id": f"Ev{i:06d}", "event_time": 1700000000 + i,
+                "event": {"text": f"event checkin code{i % 20}", "channel": "D1", "user": f"U{i}"}}
+        out.append((body, {}))
+        for retry in range(1, rng.randint(0, MAX_RETRIES) + 1):
+            out.append((body, {"X-Slack-Retry-Num": str(retry), "X-Slack-Retry-Reason": "http_timeout"}))
+    # retries trail the original by a little, as Slack's do
+    keyed = [(i + rng.uniform(0, 50) * bool(headers), body, headers) for i, (body, headers) in enumerate(out)]
+    return [(body, headers) for _, body, headers in sorted(keyed, key=lambda x: x[0])]
+
+
+def run(dedup, storm: list, expected: int) -> dict:
+    main.deduplicator = dedup
+    workload = main.router = Workload()
+    client = TestClient(main.app)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for body, headers in storm:
+            client.post("/slack", json=body, headers=headers)
+        while workload.handled < expected and time.perf_counter() - start < 300:
+            time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    backend = getattr(dedup, "backend", None)
+    dedup_calls = backend.total_calls if backend is not None else 0
+    return {
+        "handled": workload.handled,
+        "db_calls": workload.base.total_calls + dedup_calls,
+        "dedup_calls": dedup_calls,
+        "slack_calls": workload.slack_calls,
+        "time": elapsed
+    }
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    storm = deliveries(n, seed)
+    print(f"{n} events, {len(storm)} deliveries ({len(storm) - n} retries), "
+          f"{common.REMOTE_LATENCY * 1000:.0f} ms per remote call\n")
+
+    modes = [
+        ("none", NoDedup(), len(storm)),
+        ("in-memory", EventDeduplicator(), n),
+        ("shared backend", EventDeduplicator(backend=common.RemoteBase(common.sqlite_base("slack-events"))), n)
+    ]
+    rows = []
+    for name, dedup, expected in modes:
+        res = run(dedup, storm, expected)
+        rows.append([name, res["handled"], f"{res['db_calls']} ({res['dedup_calls']} dedup)",
+                     res["slack_calls"], common.fmt_time(res["time"])])
+    common.table(["dedup", "handled", "DB calls", "Slack calls", "time to drain"], rows)
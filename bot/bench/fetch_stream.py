@@ -0,0 +1,75 @@
+"""
+Benchmark of reading a large base: the first page only (what the call sites
+did before, silently truncating), every page collected into a list, and
+`db.iter_fetch` streaming pages lazily, with and without prefetching the
+next page. Each item is serialized as an export would, so prefetching has
+work to overlap with.
+
+Reported per base size: items seen, time to the first item, total time and
+peak memory allocated while reading.
+
+Usage: python bench/fetch_stream.py [page size] [size ...]
+"""
+import tracemalloc
+import common
+import json
+import time
+import sys
+
+from db import iter_fetch
+
+
+def first_page(base, page_size: int):
+    return base.fetch(limit=page_size).items
+
+
+def collect(base, page_size: int):
+    items = []
+    res = base.fetch(limit=page_size)
+    items.extend(res.items)
+    while res.last:
+        res = base.fetch(limit=page_size, last=res.last)
+        items.extend(res.items)
+    return items
+
+
+def measure(read, base, page_size: int) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    first, n = None, 0
+    for item in read(base, page_size):
+        if first is None:
+            first = time.perf_counter() - start
+        json.dumps(item)
+        n += 1
+    total = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"items": n, "first": first or 0, "total": total, "peak": peak}
+
+
+READERS = [
+    ("first page only", first_page),
+    ("all pages, list", collect),
+    ("iter_fetch", lambda base, page_size: iter_fetch(base, page_size=page_size)),
+    ("iter_fetch, prefetch", lambda base, page_size: iter_fetch(base, page_size=page_size, prefetch=True))
+]
+
+
+if __name__ == "__main__":
+    page_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    sizes = [int(n) for n in sys.argv[2:]] or [10000, 100000]
+    print(f"{page_size} items per page, {common.REMOTE_LATENCY * 1000:.0f} ms per remote call\n")
+
+    rows = []
+    for size in sizes:
+        base = common.sqlite_base("records")
+        for start in range(0, size, 10000):
+            base.put_many([{"key": f"r{i:08d}", "user": f"U{i % 5000:05d}", "event": f"code{i % 300}",
+                            "time": 1700000000.0 + i} for i in range(start, min(size, start + 10000))])
+        remote = common.RemoteBase(base)
+        for name, read in READERS:
+            res = measure(read, remote, page_size)
+            rows.append([size, name, res["items"], common.fmt_time(res["first"]),
+                         common.fmt_time(res["total"]), f"{res['peak'] / 2 ** 20:.1f} MiB"])
+    common.table(["base size", "read", "items", "first item", "total", "peak memory"], rows)
@@ -0,0 +1,53 @@
+"""
+Simulates coffee rounds to compare the matchers behind `make_pairs`: for
+each channel size, runs the same number of rounds with every matcher in
+`router.matching.MATCHERS`, each keeping its own pair history, and reports
+the time to generate a round and the share of matched pairs that had met
+before.
+
+Usage: python bench/matching_sim.py [rounds] [size ...]
+"""
+from itertools import combinations
+import common
+import random
+import time
+import sys
+
+from router.matching import MATCHERS, PairHistory
+
+
+def simulate(matcher, size: int, rounds: int, seed: int = 0) -> dict:
+    random.seed(seed)
+    users = [f"U{i:05d}" for i in range(size)]
+    history = PairHistory()
+    times, pairs, repeats = [], 0, 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        groups = matcher(users, history)
+        times.append(time.perf_counter() - start)
+        for group in groups:
+            for a, b in combinations(group, 2):
+                pairs += 1
+                repeats += history.count(a, b) > 0
+        history.record(groups)
+    return {
+        "mean": sum(times) / rounds,
+        "max": max(times),
+        "repeat_rate": repeats / pairs,
+        "stored_pairs": len(history.counts)
+    }
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    sizes = [int(n) for n in sys.argv[2:]] or [50, 500, 5000]
+
+    print(f"{rounds} rounds per channel\n")
+    rows = []
+    for size in sizes:
+        for name, matcher in MATCHERS.items():
+            res = simulate(matcher, size, rounds)
+            rows.append([size, name, common.fmt_time(res["mean"]), common.fmt_time(res["max"]),
+                         f"{res['repeat_rate']:.2%}", res["stored_pairs"]])
+            print(f"  {size} members, {name}: done", file=sys.stderr)
+    common.table(["members", "matcher", "round (mean)", "round (max)", "repeat pairs", "stored pairs"], rows)
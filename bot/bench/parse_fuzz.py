@@ -0,0 +1,223 @@
+"""
+Fuzz and microbenchmark of command parsing and dispatch: the one-pass
+`utils.parse_command` and the `router.COMMANDS` table against the substring
+checks and split-and-join parser they replaced (copied below as they were).
+
+The fuzz pass feeds both parsers random commands built from real verbs,
+straight and smart quotes and odd whitespace, and reports where their
+results differ. Differences are expected where the old parser was wrong
+(crashes on empty text or a lone quote, quotes kept around single quoted
+words, smart quotes other than “ ”, quotes inside a word) and where it
+collapsed whitespace inside quotes, which the new one keeps; they are
+counted and listed by example for review rather than failed on. What is checked strictly:
+    - the new parser never raises
+    - without quotes, both parsers agree with `str.split()`
+The script exits with status 1 if either check fails.
+
+Usage: python bench/parse_fuzz.py [iterations] [seed]
+"""
+from collections import Counter
+import common
+import random
+import sys
+
+from utils import EventInfo, parse_command
+import router.router
+
+rr = sys.modules["router.router"]
+
+
+def legacy_parse_command(text: str):
+    text = text.replace(u"“", '"').replace(u"”", '"')
+    # split by spaces
+    words = text.split()
+
+    # parse words in quotes
+    args = []
+    in_quote = False
+    for word in words:
+        if word[0] == '"' and word[-1] != '"':
+            in_quote = True
+            args.append(word[1:])
+        elif word[-1] == '"' and word[0] != '"':
+            in_quote = False
+            args[-1] += " " + word[:-1]
+        elif in_quote:
+            args[-1] += " " + word
+        else:
+            args.append(word)
+
+    return args
+
+
+LEGACY_SUBCOMMANDS = {
+    "user": ("makeadmin", "register"),
+    "event": ("checkin", "create", "open", "close"),
+    "coffee": ("create", "out", "dms")
+}
+
+
+def legacy_resolve(text: list):
+    """(verb, subcommand) the old router sent a parsed command to, or None."""
+    verb = text[0].lower()
+    for name in ("user", "event", "coffee"):
+        if name in verb:
+            if len(text) == 1:
+                return None
+            subcommand = text[1].lower()
+            for candidate in LEGACY_SUBCOMMANDS[name]:
+                if subcommand == candidate:
+                    return name, candidate
+            return None
+    return None
+
+
+def resolve(text: list):
+    """(verb, subcommand) `router.router` dispatches a parsed command to, or None."""
+    if text and text[0].startswith("<@"):
+        text = text[1:]
+    verb = text[0].lower() if text else None
+    verb = rr.ALIASES.get(verb, verb)
+    subcommands = rr.COMMANDS.get(verb)
+    if subcommands is None:
+        return None
+    if None in subcommands:
+        return verb, None
+    if len(text) == 1 or text[1].lower() not in subcommands:
+        return None
+    return verb, text[1].lower()
+
+
+WORDS = ["user", "users", "User", "superuser", "event", "events", "EVENT", "coffee",
+         "committee", "checkin", "create", "open", "close", "makeadmin", "register",
+         "out", "dms", "comms", "abacus", "hunter2", "Big", "Night", "<@U123ABC>", "", "x"]
+QUOTE_CHARS = ['"', u"“", u"”", u"„"]
+SPACES = [" ", " ", " ", "  ", "\t", "\n", u" "]
+
+
+def random_text(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randrange(0, 7)):
+        word = rng.choice(WORDS)
+        if rng.random() < 0.25:
+            word = rng.choice(QUOTE_CHARS) + word
+        if rng.random() < 0.25:
+            word += rng.choice(QUOTE_CHARS)
+        parts.append(word)
+        parts.append(rng.choice(SPACES))
+    if parts and rng.random() < 0.5:
+        parts.pop() # no trailing space
+    if rng.random() < 0.1:
+        parts.insert(0, rng.choice(SPACES))
+    return "".join(parts)
+
+
+def normalized(args: list, strip: str = "") -> list:
+    return [" ".join(arg.strip(strip).split()) for arg in args]
+
+
+def fuzz(iterations: int, seed: int) -> bool:
+    rng = random.Random(seed)
+    outcomes = Counter()
+    examples = {}
+    failures = []
+
+    for _ in range(iterations):
+        text = random_text(rng)
+        try:
+            new = parse_command(text)
+        except Exception as e:
+            failures.append(f"parse_command({text!r}) raised {e!r}")
+            continue
+
+        try:
+            old = legacy_parse_command(text)
+        except Exception as e:
+            outcome = f"old parser raised {type(e).__name__}"
+            old = None
+        else:
+            if old == new:
+                outcome = "same"
+            elif normalized(old, '"') == normalized(new):
+                # the old parser kept the quotes around a single quoted word
+                # and collapsed whitespace inside quotes to one space
+                outcome = "same up to quotes and inner whitespace"
+            else:
+                outcome = "parsed differently"
+
+        if not any(q in text for q in QUOTE_CHARS) and (new != text.split() or old != text.split()):
+            failures.append(f"{text!r}: expected {text.split()!r}, got old {old!r}, new {new!r}")
+
+        # the old router indexed text[0], so it crashed on an empty command
+        if old is not None:
+            if (legacy_resolve(old) if old else "crash") != resolve(new):
+                outcome += ", dispatched differently"
+        outcomes[outcome] += 1
+        examples.setdefault(outcome, (text, old, new))
+
+    print(f"Fuzzed {iterations} commands (seed {seed})\n")
+    common.table(["outcome", "count", "share"],
+                 [[o, n, f"{n / iterations:.1%}"] for o, n in outcomes.most_common()])
+    for outcome, (text, old, new) in examples.items():
+        if outcome != "same":
+            print(f"{outcome}:\n    text {text!r}\n    old  {old!r}\n    new  {new!r}")
+    print()
+
+    for failure in failures[:20]:
+        print("FAIL", failure)
+    if failures:
+        print(f"{len(failures)} check(s) failed\n")
+    return not failures
+
+
+COMMANDS = [
+    "event checkin abacus",
+    "event create \"Big Night Out\"",
+    u"event create “Big Night Out”",
+    "user register",
+    "user makeadmin hunter2",
+    "committee comms",
+    "<@U123ABC> coffee out",
+    "events open abacus"
+]
+
+
+def noop(event, *args):
+    return "OK", 200
+
+
+def legacy_router(event: EventInfo):
+    text = legacy_parse_command(event.text)
+    # the old handlers each re-checked the subcommand in an if chain
+    legacy_resolve(text)
+    return "OK", 200
+
+
+def microbenchmark():
+    events = [EventInfo(text=text, channel="C1", user="U1") for text in COMMANDS] * 200
+    texts = [event.text for event in events]
+
+    table = rr.COMMANDS
+    rr.COMMANDS = {verb: {sub: command._replace(handler=noop, role=None)
+                          for sub, command in subcommands.items()}
+                   for verb, subcommands in table.items()}
+    try:
+        rows = [
+            ["parse", common.fmt_time(common.per_call(legacy_parse_command, texts)),
+             common.fmt_time(common.per_call(parse_command, texts))],
+            ["parse + dispatch", common.fmt_time(common.per_call(legacy_router, events)),
+             common.fmt_time(common.per_call(rr.router, events))]
+        ]
+    finally:
+        rr.COMMANDS = table
+
+    print("Per command, over typical commands (handlers stubbed out)\n")
+    common.table(["step", "old", "new"], rows)
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    ok = fuzz(iterations, seed)
+    microbenchmark()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,102 @@
+"""
+Load test of the check-in stream: many dashboards hold
+`/admin/events/{event_id}/stream` open while a rush of check-ins is
+published, as `event_checkin` does, from another thread. The route's own
+streams are consumed on one event loop, as under uvicorn; a share of them
+are slow consumers that stall for a second on every chunk they read, long
+enough to overflow their buffer during the rush.
+
+Reported per number of subscribers: publisher time per check-in (the
+cost of one broadcast), delivery latency to the fast dashboards, messages
+they missed (should be none) and slow dashboards dropped.
+
+Usage: python bench/stream_load.py [check-ins] [rate per second] [subscribers ...]
+"""
+from threading import Thread
+import statistics
+import asyncio
+import common
+import json
+import time
+import sys
+
+import main
+from pubsub import hub
+
+CODE = "abacus"
+SLOW_SHARE = 0.1
+SLOW_DELAY = 1 # seconds a slow dashboard takes to read each chunk
+
+
+async def dashboard(slow: bool, stats: dict):
+    response = await main.stream_event(CODE)
+    seen = 0
+    async for chunk in response.body_iterator:
+        now = time.time()
+        done = False
+        for part in chunk.split("\n\n"):
+            if not part.startswith("event: checkin"):
+                continue
+            message = json.loads(part.split("data: ", 1)[1])
+            if message.get("done"):
+                done = True
+                break
+            stats["latencies"].append(now - message["time"])
+            seen += 1
+        if done:
+            break
+        if slow:
+            await asyncio.sleep(SLOW_DELAY)
+    stats["slow_seen" if slow else "fast_seen"].append(seen)
+
+
+def publish(checkins: int, rate: float, stats: dict):
+    start = time.perf_counter()
+    for i in range(checkins):
+        t = time.perf_counter()
+        hub.publish(f"event:{CODE}", {"event": CODE, "user": f"U{i:05d}", "name": f"User {i}",
+                                      "time": time.time()})
+        stats["publish"].append(time.perf_counter() - t)
+        time.sleep(max(0, start + (i + 1) / rate - time.perf_counter()))
+    hub.publish(f"event:{CODE}", {"done": True})
+
+
+async def run(subscribers: int, checkins: int, rate: float) -> dict:
+    stats = {"latencies": [], "fast_seen": [], "slow_seen": [], "publish": []}
+    slow = int(subscribers * SLOW_SHARE)
+    dropped = hub.dropped
+    tasks = [asyncio.create_task(dashboard(i < slow, stats)) for i in range(subscribers)]
+    while hub.stats()["subscribers"] < subscribers:
+        await asyncio.sleep(0.01)
+
+    publisher = Thread(target=publish, args=(checkins, rate, stats))
+    publisher.start()
+    await asyncio.gather(*tasks)
+    publisher.join()
+
+    latencies = sorted(stats["latencies"])
+    return {
+        "publish": statistics.mean(stats["publish"]),
+        "p50": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+        "missed": sum(checkins - seen for seen in stats["fast_seen"]),
+        "slow": slow,
+        "dropped": hub.dropped - dropped
+    }
+
+
+if __name__ == "__main__":
+    checkins = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 200
+    sizes = [int(n) for n in sys.argv[3:]] or [20, 200, 1000]
+    main.events.put({"name": "Rush", "open": True}, CODE)
+    print(f"{checkins} check-ins at {rate:.0f}/s, {SLOW_SHARE:.0%} of dashboards taking "
+          f"{SLOW_DELAY * 1000:.0f} ms per chunk, {hub.buffer_size} buffered per dashboard\n")
+
+    rows = []
+    for subscribers in sizes:
+        res = asyncio.run(run(subscribers, checkins, rate))
+        rows.append([subscribers, common.fmt_time(res["publish"]), common.fmt_time(res["p50"]),
+                     common.fmt_time(res["p99"]), res["missed"], f"{res['dropped']}/{res['slow']}"])
+    common.table(["dashboards", "publish / check-in", "delivery (p50)", "delivery (p99)",
+                  "missed (fast)", "slow dropped"], rows)
@@ -0,0 +1,135 @@
+"""
+Benchmark of `GET /users/{email}` as the number of users grows: the
+scan-based lookup (a filtered fetch of users by email, a filtered fetch of
+their records, then their events; copied below as it was) against
+`main.get_user` with the email index and the attended events kept in the
+aggregates.
+
+Filtered fetches are simulated as Deta runs them: a query pages through the
+whole base, `limit` items scanned per call, and each call is one remote
+round trip. Both paths read the same data; caches start cold for each size.
+
+Usage: python bench/user_lookup.py [lookups] [size ...]
+"""
+from typing import NamedTuple
+import statistics
+import tempfile
+import common
+import random
+import time
+import sys
+import os
+
+from db.sqlite import SqliteStore
+from db import CachedBase, AttendanceAggregates, EmailIndex, fetch_all, fetch_first, threaded_repository
+import main
+
+RECORDS_PER_USER = 5
+EVENTS = 200
+
+
+class FetchResponse(NamedTuple):
+    count: int
+    last: str
+    items: list
+
+
+class ScanningBase:
+    """A Base whose filtered fetches scan it page by page, as Deta's do."""
+
+    def __init__(self, base):
+        self.base = base
+
+    def __getattr__(self, name):
+        return getattr(self.base, name)
+
+    def fetch(self, query=None, limit: int = 1000, last: str = None):
+        res = self.base.fetch(None, limit=limit, last=last)
+        queries = [query] if isinstance(query, dict) else (query or [{}])
+        items = [item for item in res.items
+                 if any(all(item.get(f) == v for f, v in q.items()) for q in queries)]
+        return FetchResponse(len(items), res.last, items)
+
+
+def legacy_get_user(user_email: str):
+    user_info = fetch_first(main.users, {"email": user_email})
+    if user_info is None:
+        return {"error": "User not found."}, 404
+
+    user_info['attendance'] = (main.aggregates.user_summary(user_info['key']) or {}).get('count', 0)
+    user_info['events'] = fetch_all(main.records, {"user": user_info['key']})
+
+    codes = {event['event'] for event in user_info['events']}
+    infos = {code: main.events.peek(code) for code in codes}
+    missing = [code for code, info in infos.items() if info is None]
+    if missing:
+        fetched = main.repo.run(main.repo.get_many(main.repo.events, missing))
+        for code, info in fetched.items():
+            if info is not None:
+                main.events.prime(code, info)
+        infos.update(fetched)
+    for event in user_info['events']:
+        event['info'] = infos[event['event']]
+
+    return user_info
+
+
+def seed(size: int) -> SqliteStore:
+    store = SqliteStore(os.path.join(tempfile.mkdtemp(prefix="momentum-bench-"), "bench.db"))
+    rng = random.Random(size)
+    store.base("events").put_many([{"key": f"code{e:03d}", "name": f"Event {e}", "open": False}
+                                   for e in range(EVENTS)])
+    users, records, stats = [], [], []
+    for i in range(size):
+        user_id = f"U{i:06d}"
+        codes = rng.sample(range(EVENTS), RECORDS_PER_USER)
+        users.append({"key": user_id, "name": f"User {i}", "email": f"user{i}@example.edu"})
+        records.extend({"key": f"code{c:03d}{user_id}", "user": user_id, "event": f"code{c:03d}",
+                        "time": 1700000000.0 + c} for c in codes)
+        stats.append({"key": f"user:{user_id}", "kind": "user", "ref": user_id,
+                      "count": len(codes), "events": [f"code{c:03d}" for c in codes]})
+    for name, items in (("users", users), ("records", records), ("attendance-stats", stats)):
+        for start in range(0, len(items), 10000):
+            store.base(name).put_many(items[start:start + 10000])
+    EmailIndex(store.base("user-emails")).rebuild(store.base("users"))
+    return store
+
+
+def install(store: SqliteStore):
+    def open_base(name: str):
+        return common.RemoteBase(ScanningBase(store.base(name)))
+
+    main.users = CachedBase(open_base("users"))
+    main.events = CachedBase(open_base("events"))
+    main.records = open_base("records")
+    main.aggregates = AttendanceAggregates(open_base("attendance-stats"))
+    main.emails = EmailIndex(open_base("user-emails"))
+    main.repo = threaded_repository(open_base)
+
+
+def measure(get_user, emails: list) -> float:
+    times = []
+    for email in emails:
+        start = time.perf_counter()
+        res = get_user(email)
+        times.append(time.perf_counter() - start)
+        assert isinstance(res, dict) and len(res["events"]) == RECORDS_PER_USER, res
+    return statistics.median(times)
+
+
+if __name__ == "__main__":
+    lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    sizes = [int(n) for n in sys.argv[2:]] or [1000, 5000, 20000]
+    print(f"{RECORDS_PER_USER} records per user, {lookups} lookups per size, "
+          f"{common.REMOTE_LATENCY * 1000:.0f} ms per remote call\n")
+
+    rows = []
+    for size in sizes:
+        store = seed(size)
+        emails = [f"user{i}@example.edu" for i in random.Random(0).sample(range(size), lookups)]
+        row = [size, size * RECORDS_PER_USER]
+        for get_user in (legacy_get_user, main.get_user):
+            install(store)
+            row.append(common.fmt_time(measure(get_user, emails)))
+        rows.append(row)
+    common.table(["users", "records", "scan (median)", "indexed (median)"], rows)
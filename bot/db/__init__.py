@@ -1,11 +1,80 @@
-from deta import Deta
 from dotenv import load_dotenv
+from .backends import open_backend, STORAGE_BACKEND
+from .cache import CachedBase
+from .checkins import CheckinIndex
+from .journal import AttendanceWriter
+from .fetch import iter_fetch, fetch_all, fetch_first
+from .batch import put_all
+from .aggregates import AttendanceAggregates
+from .indexes import EmailIndex
+from .repository import http_repository, threaded_repository
 import os
 
 load_dotenv()
 
-deta = Deta(os.getenv('DETA_PROJECT_KEY'))
-users = deta.Base("users")
-events = deta.Base("events")
-records = deta.Base("records")
-committees = deta.Base("temp-committees")
\ No newline at end of file
+USERS_CACHE_TTL = int(os.getenv("USERS_CACHE_TTL", 600))
+# keep this short if several instances open/close the same events
+EVENTS_CACHE_TTL = int(os.getenv("EVENTS_CACHE_TTL", 60))
+ATTENDANCE_JOURNAL = os.getenv("ATTENDANCE_JOURNAL", "/tmp/momentum-attendance.journal")
+ATTENDANCE_FLUSH_INTERVAL = float(os.getenv("ATTENDANCE_FLUSH_INTERVAL", 2))
+
+# every Base the bot uses, e.g. for migrating between backends
+BASE_NAMES = (
+    "users", "events", "records", "temp-committees", "committee-seats", 
+    "slack-events", "coffee-history", "coffee-rounds", "coffee-dms", "jobs", 
+    "attendance-stats", "user-emails"
+)
+
+open_base = open_backend()
+users = CachedBase(open_base("users"), ttl=USERS_CACHE_TTL)
+events = CachedBase(open_base("events"), ttl=EVENTS_CACHE_TTL, max_size=500)
+records = open_base("records")
+committees = open_base("temp-committees")
+committee_seats = open_base("committee-seats")
+slack_events = open_base("slack-events")
+coffee_history = open_base("coffee-history")
+coffee_rounds = open_base("coffee-rounds")
+coffee_dms = open_base("coffee-dms")
+jobs = open_base("jobs")
+aggregates = AttendanceAggregates(open_base("attendance-stats"))
+emails = EmailIndex(open_base("user-emails"))
+
+# async access to the same bases, for reads that can run concurrently
+if STORAGE_BACKEND == "deta":
+    repo = http_repository(os.getenv('DETA_PROJECT_KEY'))
+else:
+    repo = threaded_repository(open_base)
+
+checkins = CheckinIndex()
+
+# check-ins are journaled locally and written to records in the background
+attendance = AttendanceWriter(records, ATTENDANCE_JOURNAL, interval=ATTENDANCE_FLUSH_INTERVAL)
+
+
+def count_checkins(items: list):
+    """
+    Update the attendance counters for a batch of flushed check-ins. Runs on
+    the attendance writer's thread, so check-ins don't wait on the counters.
+    """
+    try:
+        names = {}
+        for user_id in {item["user"] for item in items}:
+            user = users.get(user_id)
+            names[user_id] = user.get("name") if user else None
+        aggregates.record_checkins(items, names)
+    except Exception as e:
+        print(f"Could not update attendance aggregates: {e!r}")
+
+
+attendance.on_flush(count_checkins)
+
+
+def start_attendance():
+    """
+    Recover the check-ins left in the journal and start flushing new ones.
+    Only the bot itself may call this (once, on startup): the journal
+    belongs to one running process, and tools importing `db` mustn't touch it.
+    """
+    for item in attendance.replay():
+        checkins.add(item["event"], item["user"])
+    attendance.start()
\ No newline at end of file
@@ -0,0 +1,118 @@
+from collections import defaultdict
+from .fetch import iter_fetch, fetch_all
+from .batch import put_all
+
+
+class AttendanceAggregates:
+    """
+    Attendance counters kept up to date as check-ins are flushed, so views don't
+    have to rescan the records base. Items are keyed `event:<code>` (with a
+    check-in count and the attendees' user ids and names, in the same order)
+    and `user:<user id>` (with a check-in count and the codes of the attended
+    events).
+    Args:
+        base (deta.Base): the Base the aggregates live in
+    """
+
+    def __init__(self, base):
+        self.base = base
+
+    def record_checkins(self, items: list, names: dict = None):
+        """
+        Count a batch of new check-ins, with one update per event and one
+        per user however many check-ins they have in the batch.
+        Args:
+            items (list): attendance records, with "event" and "user"
+            names (dict): user id -> name, for the events' attendee names
+        """
+        names = names or {}
+        by_event, by_user = defaultdict(list), defaultdict(list)
+        for item in {item["key"]: item for item in items}.values():
+            by_event[item["event"]].append(item["user"])
+            by_user[item["user"]].append(item["event"])
+
+        util = self.base.util
+        for code, user_ids in by_event.items():
+            attendees = [names.get(user_id) for user_id in user_ids]
+            self._upsert(f"event:{code}",
+                         {"count": util.increment(len(user_ids)), "users": util.append(user_ids),
+                          "names": util.append(attendees)},
+                         {"kind": "event", "ref": code, "count": len(user_ids), "users": user_ids,
+                          "names": attendees})
+        for user_id, codes in by_user.items():
+            self._upsert(f"user:{user_id}",
+                         {"count": util.increment(len(codes)), "events": util.append(codes)},
+                         {"kind": "user", "ref": user_id, "count": len(codes), "events": codes})
+
+    def _upsert(self, key: str, updates: dict, initial: dict):
+        try:
+            self.base.update(updates, key)
+        except Exception:
+            # the counter doesn't exist yet
+            try:
+                self.base.insert(initial, key)
+            except Exception:
+                # another check-in created it first
+                self.base.update(updates, key)
+
+    def event_summary(self, code: str):
+        """Returns the event's aggregate ({"count", "users", "names"}), or None."""
+        return self.base.get(f"event:{code}")
+
+    def user_summary(self, user_id: str):
+        """Returns the user's aggregate ({"count", "events"}), or None."""
+        return self.base.get(f"user:{user_id}")
+
+    def leaderboard(self, limit: int = 10) -> list:
+        """Returns the `limit` user aggregates with the most check-ins."""
+        ranked = sorted(iter_fetch(self.base, {"kind": "user"}),
+                        key=lambda item: item.get("count", 0),
+                        reverse=True)
+        return ranked[:limit]
+
+    def rebuild(self, records, users, fix: bool = True) -> dict:
+        """
+        Recompute every aggregate from the records base and compare them to
+        the stored ones.
+        Args:
+            records (deta.Base): the attendance records
+            users (deta.Base): the users, for attendee names
+            fix (bool): write the recomputed aggregates back
+        Returns:
+            dict: {key: (stored count, actual count)} for every aggregate that
+                had drifted
+        """
+        names = {user["key"]: user.get("name") for user in iter_fetch(users)}
+        expected = {}
+        event_users, event_names = defaultdict(list), defaultdict(list)
+        user_events = defaultdict(list)
+        for record in iter_fetch(records, prefetch=True):
+            code, user_id = record["event"], record["user"]
+            for kind, ref in (("event", code), ("user", user_id)):
+                key = f"{kind}:{ref}"
+                if key not in expected:
+                    expected[key] = {"key": key, "kind": kind, "ref": ref, "count": 0}
+                expected[key]["count"] += 1
+            event_users[f"event:{code}"].append(user_id)
+            event_names[f"event:{code}"].append(names.get(user_id))
+            user_events[f"user:{user_id}"].append(code)
+
+        for key, attendees in event_names.items():
+            expected[key]["users"] = event_users[key]
+            expected[key]["names"] = attendees
+        for key, codes in user_events.items():
+            expected[key]["events"] = codes
+
+        stored = {item["key"]: item.get("count", 0) for item in fetch_all(self.base)}
+        drift = {key: (stored.get(key, 0), item["count"]) for key, item in expected.items()
+                 if stored.get(key, 0) != item["count"]}
+        drift.update({key: (count, 0) for key, count in stored.items()
+                      if key not in expected and count})
+
+        if fix:
+            put_all(self.base, list(expected.values()))
+            for key in drift:
+                if key not in expected:
+                    self.base.delete(key)
+        return drift
+
@@ -0,0 +1,26 @@
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "deta")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "momentum.db")
+
+
+def open_backend(kind: str = STORAGE_BACKEND, path: str = SQLITE_PATH):
+    """
+    Get the storage backend the bases live in. Every backend offers the
+    `deta.Base` interface, so the rest of the bot doesn't care which it is.
+    Args:
+        kind (str): "deta" for Deta Base, or "sqlite" for a local SQLite file
+        path (str): location of the SQLite file
+    Returns:
+        callable: opens a Base by name
+    """
+    if kind == "deta":
+        from deta import Deta
+        return Deta(os.getenv('DETA_PROJECT_KEY')).Base
+    if kind == "sqlite":
+        from .sqlite import SqliteStore
+        return SqliteStore(path).base
+    raise ValueError(f"Unknown storage backend: {kind!r}")
@@ -0,0 +1,17 @@
+PUT_MANY_LIMIT = 25 # Deta accepts at most 25 items per put_many
+
+
+def put_all(base, items: list) -> int:
+    """
+    Write any number of items with as few `put_many` calls as possible.
+    Args:
+        base (deta.Base): the Base to write to
+        items (list): items to write, each with its "key"
+    Returns:
+        int: number of put_many calls made
+    """
+    calls = 0
+    for i in range(0, len(items), PUT_MANY_LIMIT):
+        base.put_many(items[i:i + PUT_MANY_LIMIT])
+        calls += 1
+    return calls
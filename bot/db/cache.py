@@ -0,0 +1,172 @@
+from collections import OrderedDict
+from threading import Lock
+from .fetch import iter_fetch
+import time
+
+MISS = object()
+PLAIN_TYPES = (str, int, float, bool, type(None), list, dict)
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire `ttl` seconds after they
+    were written.
+    """
+
+    def __init__(self, ttl: float = 300, max_size: int = 5000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = OrderedDict() # key -> (expiry, value)
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns the cached value, or MISS."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return MISS
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions
+        }
+
+
+class CachedBase:
+    """
+    Write-through cache in front of a Deta Base. `get` is served from memory
+    when possible; `put`/`put_many`/`insert` write to the Base and then cache
+    the stored item. `update` applies plain field sets to the cached item and
+    invalidates it otherwise, since operations like `util.increment` can't be
+    applied locally; `delete` invalidates the key. Anything else (`fetch`,
+    `util`, ...) goes straight to the Base. Callbacks registered with
+    `on_change` are called with the key of every item written through it, so
+    caches derived from the items can be invalidated too.
+    Args:
+        base (deta.Base): the Base to wrap
+        ttl (float): seconds an item may be served from the cache
+        max_size (int): maximum number of cached items
+    """
+
+    def __init__(self, base, ttl: float = 300, max_size: int = 5000):
+        self.base = base
+        self.cache = TTLCache(ttl, max_size)
+        self._listeners = []
+
+    def __getattr__(self, name):
+        return getattr(self.base, name)
+
+    def on_change(self, callback):
+        """Call `callback(key)` whenever an item is written or deleted."""
+        self._listeners.append(callback)
+
+    def _changed(self, key: str):
+        for callback in self._listeners:
+            callback(key)
+
+    def get(self, key: str):
+        item = self.cache.get(key)
+        if item is MISS:
+            item = self.base.get(key)
+            if item is None:
+                return None
+            self.cache.set(key, item)
+        return dict(item)
+
+    def peek(self, key: str):
+        """Returns a copy of the cached item, or None, without reading the Base."""
+        item = self.cache.get(key)
+        return None if item is MISS else dict(item)
+
+    def prime(self, key: str, item: dict):
+        """Cache an item read from the Base some other way."""
+        self.cache.set(key, item)
+
+    def put(self, data, key: str = None, **kwargs):
+        item = self.base.put(data, key, **kwargs)
+        self.cache.set(item["key"], item)
+        self._changed(item["key"])
+        return item
+
+    def put_many(self, items, **kwargs):
+        res = self.base.put_many(items, **kwargs)
+        for item in res.get("processed", {}).get("items", []):
+            self.cache.set(item["key"], item)
+            self._changed(item["key"])
+        return res
+
+    def insert(self, data, key: str = None, **kwargs):
+        item = self.base.insert(data, key, **kwargs)
+        self.cache.set(item["key"], item)
+        self._changed(item["key"])
+        return item
+
+    def update(self, updates: dict, key: str, **kwargs):
+        try:
+            res = self.base.update(updates, key, **kwargs)
+        except Exception:
+            self.cache.invalidate(key)
+            raise
+
+        # plain field sets can be applied to the cached copy, anything else
+        # (util.increment, util.append, ...) has to be re-read from the Base
+        item = self.cache.get(key)
+        plain = all(isinstance(v, PLAIN_TYPES) and "." not in k for k, v in updates.items())
+        if item is not MISS and plain:
+            self.cache.set(key, {**item, **updates})
+        else:
+            self.cache.invalidate(key)
+        self._changed(key)
+        return res
+
+    def delete(self, key: str):
+        try:
+            return self.base.delete(key)
+        finally:
+            self.cache.invalidate(key)
+            self._changed(key)
+
+    def warm(self) -> int:
+        """
+        Load every item of the Base into the cache.
+        Returns:
+            int: number of items loaded
+        """
+        n = 0
+        for item in iter_fetch(self.base, prefetch=True):
+            self.cache.set(item["key"], item)
+            n += 1
+        return n
+
+    def stats(self) -> dict:
+        return self.cache.stats()
@@ -0,0 +1,50 @@
+from collections import defaultdict
+from threading import Lock
+
+
+class CheckinIndex:
+    """
+    In-process record of which users have checked in to which open events.
+    Membership is only ever a positive answer: a user missing from the set
+    may still have checked in through another instance, so callers fall back
+    to the records base on a miss.
+    """
+
+    def __init__(self):
+        self._events = defaultdict(set)
+        self._lock = Lock()
+
+    def contains(self, code: str, user_id: str) -> bool:
+        with self._lock:
+            return user_id in self._events.get(code, ())
+
+    def add(self, code: str, user_id: str) -> bool:
+        """
+        Mark a user as checked in to an event.
+        Returns:
+            bool: False if they already were, so concurrent check-ins of the
+                same user can tell which of them is the first
+        """
+        with self._lock:
+            users = self._events[code]
+            if user_id in users:
+                return False
+            users.add(user_id)
+            return True
+
+    def discard(self, code: str, user_id: str):
+        """Undo an `add` whose check-in couldn't be recorded."""
+        with self._lock:
+            self._events.get(code, set()).discard(user_id)
+
+    def drop(self, code: str):
+        """Forget an event, e.g. once it is closed."""
+        with self._lock:
+            self._events.pop(code, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "events": len(self._events),
+                "checkins": sum(len(s) for s in self._events.values())
+            }
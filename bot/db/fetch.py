@@ -0,0 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+FETCH_PAGE_SIZE = int(os.getenv("FETCH_PAGE_SIZE", 1000))
+
+
+def iter_fetch(base, query=None, page_size: int = FETCH_PAGE_SIZE, prefetch: bool = False, 
+               stats: dict = None):
+    """
+    Lazily yield every item matching a query, following Deta's `last` cursor
+    across pages so results are never truncated to the first page.
+    Args:
+        base (deta.Base): the Base to query
+        query (dict or list): Deta query, or None for every item
+        page_size (int): number of items requested per page
+        prefetch (bool): fetch the next page in the background while the
+            current one is being consumed
+        stats (dict): if given, stats["calls"] is incremented per page fetched
+    Yields:
+        dict: matching items, in Deta's order
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault("calls", 0)
+
+    if not prefetch:
+        last = None
+        while True:
+            res = base.fetch(query, limit=page_size, last=last)
+            stats["calls"] += 1
+            yield from res.items
+            if not res.last:
+                return
+            last = res.last
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        page = pool.submit(base.fetch, query, limit=page_size)
+        while True:
+            res = page.result()
+            stats["calls"] += 1
+            if res.last:
+                page = pool.submit(base.fetch, query, limit=page_size, last=res.last)
+            yield from res.items
+            if not res.last:
+                return
+
+
+def fetch_all(base, query=None, page_size: int = FETCH_PAGE_SIZE) -> list:
+    """
+    Fetch every item matching a query.
+    Args:
+        base (deta.Base): the Base to query
+        query (dict or list): Deta query, or None for every item
+        page_size (int): number of items requested per page
+    Returns:
+        list: all matching items
+    """
+    return list(iter_fetch(base, query, page_size, prefetch=True))
+
+
+def fetch_first(base, query=None):
+    """Returns the first item matching a query, or None."""
+    return next(iter_fetch(base, query), None)
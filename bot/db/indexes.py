@@ -0,0 +1,49 @@
+from typing import Optional
+from .fetch import iter_fetch, fetch_all
+from .batch import put_all
+
+
+class EmailIndex:
+    """
+    Secondary index from email addresses to user keys, so a user can be found
+    by email with one keyed get instead of a filtered scan of the users base.
+    Items are keyed by the lowercased address and hold the user key. Entries
+    are written whenever a user is stored; a stale entry (e.g. after a user's
+    email changed) is detected by the caller comparing the user's email.
+    Args:
+        base (deta.Base): the Base the index lives in
+    """
+
+    def __init__(self, base):
+        self.base = base
+
+    @staticmethod
+    def _key(email: str) -> str:
+        return email.strip().lower()
+
+    def set(self, email: str, user_id: str):
+        if email:
+            self.base.put({"user": user_id}, self._key(email))
+
+    def lookup(self, email: str) -> Optional[str]:
+        """Returns the key of the user with this email, or None."""
+        item = self.base.get(self._key(email))
+        return item["user"] if item else None
+
+    def rebuild(self, users) -> int:
+        """
+        Rewrite the index from the users base, dropping entries for emails
+        no user has anymore.
+        Returns:
+            int: number of indexed users
+        """
+        items = {}
+        for user in iter_fetch(users, prefetch=True):
+            if user.get("email"):
+                key = self._key(user["email"])
+                items[key] = {"key": key, "user": user["key"]}
+        put_all(self.base, list(items.values()))
+        for item in fetch_all(self.base):
+            if item["key"] not in items:
+                self.base.delete(item["key"])
+        return len(items)
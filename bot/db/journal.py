@@ -0,0 +1,166 @@
+from threading import Thread, Lock, Event
+from metrics import Summary
+from .batch import PUT_MANY_LIMIT
+import json
+import time
+import os
+
+
+class AttendanceWriter:
+    """
+    Write-behind writer for attendance records. `write` appends the record to
+    a local journal file and fsyncs it, so a check-in can be acknowledged
+    once it's on local disk. A background thread then flushes the records to
+    the Base with `put_many`, whenever `batch_size` records are pending or
+    every `interval` seconds. The journal is truncated once everything in it
+    is flushed, and replayed on startup to recover records that weren't;
+    replaying is safe since records are keyed by event and user. Callbacks
+    registered with `on_flush` are called with every batch that was written.
+    Args:
+        base (deta.Base): the Base records are flushed to
+        path (str): location of the journal file
+        batch_size (int): number of pending records that triggers a flush
+        interval (float): seconds between time-triggered flushes
+    """
+
+    def __init__(self, base, path: str, batch_size: int = PUT_MANY_LIMIT, interval: float = 2):
+        self.base = base
+        self.path = path
+        self.batch_size = min(batch_size, PUT_MANY_LIMIT)
+        self.interval = interval
+
+        self._pending = [] # (time written, item)
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._wake = Event()
+        self._stopped = Event()
+        self._thread = None
+        self._listeners = []
+        self._journal = None # opened by `replay`/`start`
+
+        self.flush_lag = Summary()
+        self.flushed = 0
+        self.failures = 0
+
+    def replay(self) -> list:
+        """
+        Queue the records left in the journal by a previous run. Records
+        that already made it to the Base aren't queued again, so the flush
+        listeners (e.g. the attendance counters) see each record once.
+        Returns:
+            list: the recovered records
+        """
+        recovered = {}
+        self._open()
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue # torn write from a crash
+                recovered[item["key"]] = item
+
+        now = time.time()
+        unflushed = [item for key, item in recovered.items() if self.base.get(key) is None]
+        with self._lock:
+            self._pending.extend((now, item) for item in unflushed)
+        if recovered:
+            print(f"Recovered {len(unflushed)} unflushed attendance records "
+                  f"({len(recovered) - len(unflushed)} were already flushed)")
+        return list(recovered.values())
+
+    def pending(self) -> list:
+        """
+        Returns the records not flushed yet. A record stays pending until the
+        flush listeners have seen it, so reading this before the counters
+        misses no check-in (but may see one in both).
+        """
+        with self._lock:
+            return [item for _, item in self._pending]
+
+    def on_flush(self, callback):
+        """Call `callback(items)` with every batch of records flushed to the Base."""
+        self._listeners.append(callback)
+
+    def _open(self):
+        with self._lock:
+            if self._journal is None:
+                self._journal = open(self.path, "a", encoding="utf-8")
+
+    def start(self):
+        self._open()
+        self._thread = Thread(target=self._run, name="attendance-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, data: dict, key: str):
+        """
+        Durably queue a record.
+        Args:
+            data (dict): the record
+            key (str): the record key
+        """
+        item = {**data, "key": key}
+        line = json.dumps(item) + "\n"
+        with self._lock:
+            if self._journal is None:
+                raise RuntimeError("AttendanceWriter.start() wasn't called")
+            self._journal.write(line)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._pending.append((time.time(), item))
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Flush pending records to the Base in batches."""
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = self._pending[:self.batch_size]
+                if not batch:
+                    return
+
+                try:
+                    self.base.put_many([item for _, item in batch])
+                except Exception as e:
+                    self.failures += 1
+                    print(f"Attendance flush failed, will retry: {e!r}")
+                    return
+
+                self.flush_lag.observe(time.time() - batch[0][0])
+                self.flushed += len(batch)
+                for callback in self._listeners:
+                    callback([item for _, item in batch])
+                with self._lock:
+                    del self._pending[:len(batch)]
+                    if not self._pending:
+                        self._journal.seek(0)
+                        self._journal.truncate()
+
+    def close(self):
+        """Stop the background thread and flush what's left."""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is None:
+            return # never started, the journal isn't ours
+        self._thread.join()
+        self.flush()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+            oldest = self._pending[0][0] if pending else None
+        return {
+            "pending": pending,
+            "oldest_pending_age": round(time.time() - oldest, 3) if oldest else 0,
+            "flushed": self.flushed,
+            "failures": self.failures,
+            "flush_lag": self.flush_lag.snapshot()
+        }
@@ -0,0 +1,168 @@
+from threading import Thread
+from typing import NamedTuple
+from urllib.parse import quote
+import asyncio
+import httpx
+
+DETA_BASE_URL = "https://database.deta.sh/v1"
+
+
+class FetchResponse(NamedTuple):
+    count: int
+    last: str
+    items: list
+
+
+class HttpBase:
+    """
+    Async client for one Deta Base over the Base HTTP API.
+    Args:
+        client (httpx.AsyncClient): shared HTTP client
+        project_key (str): Deta project key
+        name (str): name of the Base
+    """
+
+    def __init__(self, client: httpx.AsyncClient, project_key: str, name: str):
+        project_id = (project_key or "").split("_")[0]
+        self.client = client
+        self.url = f"{DETA_BASE_URL}/{project_id}/{name}"
+        self.headers = {"X-API-Key": project_key or ""}
+
+    def _item_url(self, key: str) -> str:
+        return f"{self.url}/items/{quote(key, safe='')}"
+
+    async def get(self, key: str):
+        r = await self.client.get(self._item_url(key), headers=self.headers)
+        if r.status_code == 404:
+            return None
+        r.raise_for_status()
+        return r.json()
+
+    async def put_many(self, items: list) -> dict:
+        r = await self.client.put(f"{self.url}/items", json={"items": items}, headers=self.headers)
+        r.raise_for_status()
+        return r.json()
+
+    async def put(self, data: dict, key: str = None) -> dict:
+        item = {**data, "key": key} if key else data
+        res = await self.put_many([item])
+        return res["processed"]["items"][0]
+
+    async def insert(self, data: dict, key: str = None) -> dict:
+        item = {**data, "key": key} if key else data
+        r = await self.client.post(f"{self.url}/items", json={"item": item}, headers=self.headers)
+        if r.status_code == 409:
+            raise Exception(f"Item with key '{key}' already exists")
+        r.raise_for_status()
+        return r.json()
+
+    async def update(self, updates: dict, key: str, increment: dict = None, append: dict = None):
+        body = {"set": updates, "increment": increment or {}, "append": append or {}}
+        r = await self.client.patch(self._item_url(key), json=body, headers=self.headers)
+        if r.status_code == 404:
+            raise Exception(f"Key '{key}' not found")
+        r.raise_for_status()
+
+    async def delete(self, key: str):
+        r = await self.client.delete(self._item_url(key), headers=self.headers)
+        r.raise_for_status()
+
+    async def fetch(self, query=None, limit: int = 1000, last: str = None) -> FetchResponse:
+        if isinstance(query, dict):
+            query = [query]
+        body = {"query": query or [], "limit": limit}
+        if last:
+            body["last"] = last
+        r = await self.client.post(f"{self.url}/query", json=body, headers=self.headers)
+        r.raise_for_status()
+        res = r.json()
+        paging = res.get("paging", {})
+        return FetchResponse(paging.get("size", 0), paging.get("last"), res.get("items", []))
+
+
+class ThreadedBase:
+    """
+    Async interface over a synchronous Base (e.g. a SqliteBase), running
+    each call in a worker thread.
+    Args:
+        base: the Base to wrap
+    """
+
+    def __init__(self, base):
+        self.base = base
+
+    async def get(self, key: str):
+        return await asyncio.to_thread(self.base.get, key)
+
+    async def put_many(self, items: list) -> dict:
+        return await asyncio.to_thread(self.base.put_many, items)
+
+    async def put(self, data: dict, key: str = None) -> dict:
+        return await asyncio.to_thread(self.base.put, data, key)
+
+    async def insert(self, data: dict, key: str = None) -> dict:
+        return await asyncio.to_thread(self.base.insert, data, key)
+
+    async def update(self, updates: dict, key: str, increment: dict = None, append: dict = None):
+        util = self.base.util
+        updates = {**updates,
+                   **{field: util.increment(n) for field, n in (increment or {}).items()},
+                   **{field: util.append(v) for field, v in (append or {}).items()}}
+        await asyncio.to_thread(self.base.update, updates, key)
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self.base.delete, key)
+
+    async def fetch(self, query=None, limit: int = 1000, last: str = None):
+        return await asyncio.to_thread(self.base.fetch, query, limit=limit, last=last)
+
+
+class AsyncRepository:
+    """
+    Async access to the bot's bases, so independent reads can run
+    concurrently. The repository owns an event loop on a background thread;
+    synchronous code (e.g. the router handlers) runs coroutines on it with
+    `run`/`gather`.
+    Args:
+        make_base (callable): returns the backend (HttpBase, ThreadedBase)
+            for a Base name
+    """
+
+    BASES = {
+        "users": "users",
+        "events": "events",
+        "records": "records"
+    }
+
+    def __init__(self, make_base):
+        for attr, name in self.BASES.items():
+            setattr(self, attr, make_base(name))
+        self._loop = asyncio.new_event_loop()
+        Thread(target=self._loop.run_forever, name="repository", daemon=True).start()
+
+    def run(self, coro):
+        """Run a coroutine on the repository loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def gather(self, *coros) -> list:
+        """Run several coroutines concurrently and return their results."""
+        return self.run(self._gather(*coros))
+
+    @staticmethod
+    async def _gather(*coros) -> list:
+        return list(await asyncio.gather(*coros))
+
+    async def get_many(self, base, keys: list) -> dict:
+        """Get several items of a base concurrently, as {key: item or None}."""
+        items = await asyncio.gather(*(base.get(key) for key in keys))
+        return dict(zip(keys, items))
+
+
+def http_repository(project_key: str, max_connections: int = 20) -> AsyncRepository:
+    client = httpx.AsyncClient(timeout=10, limits=httpx.Limits(max_connections=max_connections))
+    return AsyncRepository(lambda name: HttpBase(client, project_key, name))
+
+
+def threaded_repository(open_base) -> AsyncRepository:
+    return AsyncRepository(lambda name: ThreadedBase(open_base(name)))
+
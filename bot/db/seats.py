@@ -0,0 +1,105 @@
+from threading import Lock
+from .fetch import iter_fetch
+import time
+
+
+class SeatAllocator:
+    """
+    Enforces capacity limits on groups (e.g. committees) without scanning or
+    racing. Every group has numbered seats stored as items keyed
+    `<group>:<n>`; taking a seat is an `insert`, which fails if another
+    request took that seat first, so a group can never be overfilled. Which
+    seats are taken is cached in process and reconciled against the Base
+    every `reconcile_after` seconds, so a full group is refused in O(1).
+    Args:
+        base (deta.Base): where seats are stored
+        capacities (dict): maximum number of seats per group
+        members_of (callable): optional, returns the holders already in a
+            group; holders without a seat are given one when reconciling
+        reconcile_after (float): seconds the cached seat map is trusted
+    """
+
+    def __init__(self, base, capacities: dict, members_of=None, reconcile_after: float = 60):
+        self.base = base
+        self.capacities = capacities
+        self.members_of = members_of
+        self.reconcile_after = reconcile_after
+        self._seats = {} # group -> {seat number: holder}
+        self._checked = {} # group -> time of the last reconcile
+        self._lock = Lock()
+
+    def reconcile(self, group: str):
+        """Reload a group's seats from the Base."""
+        seats = {item["seat"]: item["holder"] for item in iter_fetch(self.base, {"group": group})}
+
+        if self.members_of:
+            seated = set(seats.values())
+            for holder in self.members_of(group):
+                if holder not in seated:
+                    free = self._free(group, seats)
+                    if free is None:
+                        break
+                    self._claim(group, free, holder, seats)
+
+        with self._lock:
+            self._seats[group] = seats
+            self._checked[group] = time.monotonic()
+
+    def _ensure(self, group: str):
+        if time.monotonic() - self._checked.get(group, float("-inf")) > self.reconcile_after:
+            self.reconcile(group)
+
+    def _free(self, group: str, seats: dict):
+        for n in range(self.capacities[group]):
+            if n not in seats:
+                return n
+        return None
+
+    def _claim(self, group: str, n: int, holder: str, seats: dict) -> bool:
+        try:
+            self.base.insert({"group": group, "seat": n, "holder": holder}, f"{group}:{n}")
+        except Exception as e:
+            if "already exists" not in str(e):
+                raise
+            with self._lock:
+                seats[n] = None # taken by someone we haven't seen yet
+            return False
+        with self._lock:
+            seats[n] = holder
+        return True
+
+    def reserve(self, group: str, holder: str) -> bool:
+        """
+        Take a seat in a group.
+        Args:
+            group (str): the group
+            holder (str): who takes the seat
+        Returns:
+            bool: False if the group is full
+        """
+        self._ensure(group)
+        seats = self._seats[group]
+        while True:
+            with self._lock:
+                n = self._free(group, seats)
+            if n is None:
+                return False
+            if self._claim(group, n, holder, seats):
+                return True
+
+    def release(self, group: str, holder: str):
+        """Give up a holder's seat in a group, if they have one."""
+        self._ensure(group)
+        seats = self._seats[group]
+        with self._lock:
+            taken = [n for n, h in seats.items() if h == holder]
+            for n in taken:
+                del seats[n]
+        for n in taken:
+            self.base.delete(f"{group}:{n}")
+
+    def stats(self) -> dict:
+        """Seats taken and free per group, as last reconciled (no remote calls)."""
+        with self._lock:
+            return {group: {"taken": len(seats), "free": self.capacities[group] - len(seats)}
+                    for group, seats in self._seats.items()}
@@ -0,0 +1,261 @@
+from threading import Lock, local
+from typing import NamedTuple
+import secrets
+import sqlite3
+import json
+import time
+
+# fields queried often enough to deserve an index, per base
+INDEXES = {
+    "records": ("event", "user"),
+    "users": ("email",)
+}
+
+
+class FetchResponse(NamedTuple):
+    count: int
+    last: str
+    items: list
+
+
+class _Op(NamedTuple):
+    kind: str
+    value: object = None
+
+
+class Util:
+    """The update operations of `deta.Base.util`."""
+
+    @staticmethod
+    def increment(value=1):
+        return _Op("increment", value)
+
+    @staticmethod
+    def append(value):
+        return _Op("append", value if isinstance(value, list) else [value])
+
+    @staticmethod
+    def prepend(value):
+        return _Op("prepend", value if isinstance(value, list) else [value])
+
+    @staticmethod
+    def trim():
+        return _Op("trim")
+
+
+def _path(field: str) -> str:
+    """JSON path of a (possibly nested, dotted) field of an item."""
+    if any(c in field for c in "'\"\\"):
+        raise ValueError(f"Unsupported field name: {field!r}")
+    return "'$." + ".".join(f'"{part}"' for part in field.split(".")) + "'"
+
+
+def _json(field: str) -> str:
+    """SQL for a field of an item; indexes are created on the same SQL."""
+    return "key" if field == "key" else f"json_extract(data, {_path(field)})"
+
+
+def _param(value):
+    return json.dumps(value, separators=(",", ":")) if isinstance(value, (list, dict)) else value
+
+
+def _condition(name: str, value) -> tuple:
+    """Translate one Deta query condition, e.g. `"time?gte": 0`, to SQL."""
+    field, _, op = name.partition("?")
+    column = _json(field)
+    if isinstance(value, (list, dict)) and op in ("", "ne"):
+        column = f"json({column})"
+        value = _param(value)
+
+    if op == "":
+        return (f"{column} IS NULL", []) if value is None else (f"{column} = ?", [value])
+    if op == "ne":
+        return f"{column} IS NOT ?", [value]
+    if op in ("lt", "gt", "lte", "gte"):
+        sql = {"lt": "<", "gt": ">", "lte": "<=", "gte": ">="}[op]
+        return f"{column} {sql} ?", [value]
+    if op == "pfx":
+        return f"substr({column}, 1, length(?)) = ?", [value, value]
+    if op == "r":
+        return f"{column} BETWEEN ? AND ?", list(value)
+    if op in ("contains", "not_contains"):
+        path = _path(field)
+        sql = (f"(CASE json_type(data, {path}) WHEN 'array' "
+               f"THEN EXISTS (SELECT 1 FROM json_each(data, {path}) WHERE value = ?) "
+               f"ELSE instr({column}, ?) > 0 END)")
+        if op == "not_contains":
+            sql = f"NOT {sql}"
+        return sql, [value, value]
+    raise ValueError(f"Unsupported query operator: {op!r}")
+
+
+def _where(query) -> tuple:
+    """SQL for a Deta query: a dict of conditions, or a list of them OR'ed."""
+    if not query:
+        return "1", []
+    if isinstance(query, dict):
+        query = [query]
+    clauses, params = [], []
+    for conditions in query:
+        parts = []
+        for name, value in conditions.items():
+            sql, args = _condition(name, value)
+            parts.append(sql)
+            params.extend(args)
+        clauses.append("(" + (" AND ".join(parts) or "1") + ")")
+    return " OR ".join(clauses), params
+
+
+def _apply(item: dict, updates: dict):
+    for name, value in updates.items():
+        *parents, field = name.split(".")
+        target = item
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        if not isinstance(value, _Op):
+            target[field] = value
+        elif value.kind == "trim":
+            target.pop(field, None)
+        elif value.kind == "increment":
+            target[field] = target.get(field, 0) + value.value
+        elif value.kind == "append":
+            target[field] = target.get(field, []) + value.value
+        elif value.kind == "prepend":
+            target[field] = value.value + target.get(field, [])
+
+
+class SqliteStore:
+    """
+    A SQLite database (in WAL mode, so reads don't wait on writes) holding
+    one table per Base. Each thread gets its own connection.
+    Args:
+        path (str): location of the database file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = local()
+        self._tables = set()
+        self._lock = Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _ensure(self, name: str):
+        with self._lock:
+            if name in self._tables:
+                return
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{name}" '
+                              '(key TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL)')
+            for field in INDEXES.get(name, ()):
+                self.conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}_{field}" '
+                                  f'ON "{name}" ({_json(field)})')
+            self._tables.add(name)
+
+    def base(self, name: str) -> "SqliteBase":
+        if '"' in name:
+            raise ValueError(f"Unsupported Base name: {name!r}")
+        self._ensure(name)
+        return SqliteBase(self, name)
+
+
+class SqliteBase:
+    """
+    A Base stored in a SQLite table, with the same interface and semantics
+    as `deta.Base`: items are JSON documents keyed by "key", `update`
+    supports the `util` operations, `fetch` supports Deta queries and pages
+    by key, and items written with `expire_in`/`expire_at` stop being
+    returned once they expire.
+    """
+
+    util = Util()
+
+    def __init__(self, store: SqliteStore, name: str):
+        self.store = store
+        self.name = name
+
+    def _alive(self) -> str:
+        return f"(expires IS NULL OR expires > {time.time()!r})"
+
+    @staticmethod
+    def _row(data: dict, key: str = None, expire_in: float = None, expire_at=None) -> tuple:
+        item = dict(data)
+        key = key or item.get("key") or secrets.token_hex(6)
+        item["key"] = key
+        if expire_in is not None:
+            item["__expires"] = int(time.time() + expire_in)
+        elif expire_at is not None:
+            item["__expires"] = int(expire_at.timestamp() if hasattr(expire_at, "timestamp") else expire_at)
+        return item, (key, json.dumps(item), item.get("__expires"))
+
+    def get(self, key: str):
+        row = self.store.conn.execute(
+            f'SELECT data FROM "{self.name}" WHERE key = ? AND {self._alive()}', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, data: dict, key: str = None, expire_in: float = None, expire_at=None) -> dict:
+        item, row = self._row(data, key, expire_in, expire_at)
+        self.store.conn.execute(f'INSERT OR REPLACE INTO "{self.name}" VALUES (?, ?, ?)', row)
+        return item
+
+    def put_many(self, items: list, expire_in: float = None, expire_at=None) -> dict:
+        rows = [self._row(data, None, expire_in, expire_at) for data in items]
+        conn = self.store.conn
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(f'INSERT OR REPLACE INTO "{self.name}" VALUES (?, ?, ?)',
+                             [row for _, row in rows])
+        return {"processed": {"items": [item for item, _ in rows]}}
+
+    def insert(self, data: dict, key: str = None, expire_in: float = None, expire_at=None) -> dict:
+        item, row = self._row(data, key, expire_in, expire_at)
+        conn = self.store.conn
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # an expired item doesn't block the key, as in Deta
+            conn.execute(f'DELETE FROM "{self.name}" WHERE key = ? AND NOT {self._alive()}', (row[0],))
+            try:
+                conn.execute(f'INSERT INTO "{self.name}" VALUES (?, ?, ?)', row)
+            except sqlite3.IntegrityError:
+                raise Exception(f"Item with key '{row[0]}' already exists")
+        return item
+
+    def update(self, updates: dict, key: str, expire_in: float = None, expire_at=None):
+        conn = self.store.conn
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(f'SELECT data FROM "{self.name}" WHERE key = ? AND {self._alive()}',
+                               (key,)).fetchone()
+            if row is None:
+                raise Exception(f"Key '{key}' not found")
+            item = json.loads(row[0])
+            _apply(item, updates)
+            item, row = self._row(item, key, expire_in, expire_at)
+            conn.execute(f'UPDATE "{self.name}" SET data = ?, expires = ? WHERE key = ?',
+                         (row[1], row[2], key))
+
+    def delete(self, key: str):
+        self.store.conn.execute(f'DELETE FROM "{self.name}" WHERE key = ?', (key,))
+
+    def fetch(self, query=None, limit: int = 1000, last: str = None) -> FetchResponse:
+        where, params = _where(query)
+        if last is not None:
+            where = f"({where}) AND key > ?"
+            params.append(last)
+        rows = self.store.conn.execute(
+            f'SELECT data FROM "{self.name}" WHERE ({where}) AND {self._alive()} '
+            'ORDER BY key LIMIT ?', params + [limit + 1]).fetchall()
+        items = [json.loads(data) for data, in rows[:limit]]
+        return FetchResponse(len(items), items[-1]["key"] if len(rows) > limit else None, items)
+
+    def purge_expired(self) -> int:
+        """Delete expired items, which reads already skip. Returns how many."""
+        return self.store.conn.execute(
+            f'DELETE FROM "{self.name}" WHERE NOT {self._alive()}').rowcount
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from dotenv import load_dotenv
+from threading import Lock
+import time
+import os
+
+load_dotenv()
+
+# how long an event id is remembered; Slack gives up retrying after ~5 minutes
+DEDUP_TTL = int(os.getenv("DEDUP_TTL", 900))
+DEDUP_MAX_SIZE = int(os.getenv("DEDUP_MAX_SIZE", 10000))
+
+
+class EventDeduplicator:
+    """
+    Remembers recently seen Slack event ids so that retried deliveries can be
+    dropped before they are routed. Ids are kept in a TTL-bounded LRU in
+    memory; an optional shared backend (any Base with `insert`) lets several
+    instances of the bot agree on which deliveries were already taken.
+    """
+
+    def __init__(self, ttl: int = DEDUP_TTL, max_size: int = DEDUP_MAX_SIZE, backend=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.backend = backend
+        self._seen = OrderedDict() # event id -> expiry timestamp
+        self._lock = Lock()
+        self.duplicates = 0
+
+    def seen(self, event_id: str) -> bool:
+        """
+        Mark an event id as seen.
+        Args:
+            event_id (str): Slack event id
+        Returns:
+            bool: True if the id was already seen, i.e. the delivery is a
+                duplicate and should be dropped
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if event_id in self._seen:
+                # a retry restarts the TTL, so expiries stay in order
+                self._seen[event_id] = now + self.ttl
+                self._seen.move_to_end(event_id)
+                self.duplicates += 1
+                return True
+            self._seen[event_id] = now + self.ttl
+            if len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+
+        if self.backend is not None and not self._claim(event_id):
+            with self._lock:
+                self.duplicates += 1
+            return True
+        return False
+
+    def forget(self, event_id: str):
+        """Forget an event id, e.g. if it was rejected and Slack should retry it."""
+        with self._lock:
+            self._seen.pop(event_id, None)
+        if self.backend is not None:
+            try:
+                self.backend.delete(event_id)
+            except Exception as e:
+                print(f"Dedup: could not release {event_id}: {e!r}")
+
+    def _expire(self, now: float):
+        # entries are in expiry order, so expired ones are at the front
+        while self._seen:
+            event_id, expires = next(iter(self._seen.items()))
+            if expires > now:
+                break
+            self._seen.popitem(last=False)
+
+    def _claim(self, event_id: str) -> bool:
+        # insert fails if another instance already claimed the key
+        try:
+            self.backend.insert({"claimed_at": time.time()}, event_id, expire_in=self.ttl)
+        except Exception as e:
+            if "already exists" in str(e):
+                return False
+            print(f"Dedup: shared backend unavailable: {e!r}")
+        return True
+
+    def metrics(self) -> dict:
+        return {
+            "tracked": len(self._seen),
+            "duplicates_dropped": self.duplicates
+        }
@@ -0,0 +1,98 @@
+from dotenv import load_dotenv
+from threading import Thread, Lock
+from metrics import Summary
+import queue
+import time
+import os
+
+load_dotenv()
+
+# number of worker threads; 0 runs handlers inline inside the request
+DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", 4))
+# maximum number of events waiting for a worker before new ones are rejected
+DISPATCH_QUEUE_SIZE = int(os.getenv("DISPATCH_QUEUE_SIZE", 200))
+
+
+class Dispatcher:
+    """
+    Bounded in-process worker pool. Lets the Slack endpoint acknowledge an
+    event right away and run the handler in the background.
+    """
+
+    def __init__(self, workers: int = DISPATCH_WORKERS, queue_size: int = DISPATCH_QUEUE_SIZE):
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = Lock()
+
+        self.queue_wait = Summary()
+        self.handler_latency = Summary()
+        self.rejected = 0
+        self.errors = 0
+
+        for i in range(workers):
+            t = Thread(target=self._work, name=f"dispatch-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, fn, *args) -> bool:
+        """
+        Hand a job to the pool.
+        Args:
+            fn (callable): the handler to run
+            *args: arguments passed to the handler
+        Returns:
+            bool: False if the queue is full and the job was rejected, so the
+                caller can apply backpressure
+        """
+        if self.workers == 0:
+            self._run(time.monotonic(), fn, args)
+            return True
+
+        try:
+            self._queue.put_nowait((time.monotonic(), fn, args))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+        return True
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            self._run(*job)
+
+    def _run(self, enqueued: float, fn, args):
+        started = time.monotonic()
+        self.queue_wait.observe(started - enqueued)
+        try:
+            fn(*args)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            print(f"Dispatcher: {fn.__name__} failed: {e!r}")
+        finally:
+            self.handler_latency.observe(time.monotonic() - started)
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "queue_wait": self.queue_wait.snapshot(),
+            "handler_latency": self.handler_latency.snapshot()
+        }
+
+    def shutdown(self, timeout: float = 10):
+        """Let the workers finish queued jobs, then stop them."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join(timeout)
+
+
+dispatcher = Dispatcher()
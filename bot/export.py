@@ -0,0 +1,124 @@
+from datetime import datetime, timezone
+from db import iter_fetch
+import csv
+import io
+
+COLUMNS = ("event", "event_name", "user", "name", "email", "time")
+CSV_CHUNK_ROWS = 500 # rows per chunk of the CSV stream
+PARQUET_BATCH_ROWS = 10000 # rows per Parquet row group
+
+
+def iter_attendance(records, users, events, query=None):
+    """
+    Yield one flat row per attendance record, joined against the users and
+    events. Users and events are loaded up front (only the fields the rows
+    need); records are read page by page, so memory doesn't grow with the
+    number of records.
+    Args:
+        records (deta.Base): the attendance records
+        users (deta.Base): the users, for names and emails
+        events (deta.Base): the events, for event names
+        query (dict): optional filter on the records, e.g. {"event": code}
+    Yields:
+        dict: a row with the COLUMNS as keys
+    """
+    people = {user["key"]: (user.get("name"), user.get("email")) for user in iter_fetch(users)}
+    event_names = {event["key"]: event.get("name") for event in iter_fetch(events)}
+
+    for record in iter_fetch(records, query, prefetch=True):
+        name, email = people.get(record["user"], (None, None))
+        time = record.get("time")
+        yield {
+            "event": record["event"],
+            "event_name": event_names.get(record["event"]),
+            "user": record["user"],
+            "name": name,
+            "email": email,
+            "time": datetime.fromtimestamp(time, timezone.utc) if time is not None else None
+        }
+
+
+def stream_csv(rows):
+    """Serialize rows as CSV, yielding a chunk every CSV_CHUNK_ROWS rows."""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=COLUMNS)
+    writer.writeheader()
+    for i, row in enumerate(rows, 1):
+        if row["time"] is not None:
+            row = {**row, "time": row["time"].isoformat()}
+        writer.writerow(row)
+        if i % CSV_CHUNK_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+class _ChunkSink:
+    """
+    Write-only file that hands out what was written since the last `take`,
+    while `tell` keeps counting from the start as Parquet's offsets need.
+    """
+
+    def __init__(self):
+        self.closed = False
+        self._chunks = []
+        self._pos = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def require_pyarrow():
+    """Import pyarrow, which Parquet exports need but the bot doesn't."""
+    import pyarrow
+    import pyarrow.parquet
+    return pyarrow
+
+
+def stream_parquet(rows):
+    """
+    Serialize rows as Parquet, one row group per PARQUET_BATCH_ROWS rows,
+    yielding each row group as soon as it is written.
+    Raises:
+        ImportError: if pyarrow isn't installed
+    """
+    pa = require_pyarrow()
+    schema = pa.schema([(column, pa.string()) for column in COLUMNS[:-1]] +
+                       [("time", pa.timestamp("us", tz="UTC"))])
+    sink = _ChunkSink()
+
+    def batches():
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == PARQUET_BATCH_ROWS:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    writer = pa.parquet.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+    try:
+        for batch in batches():
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
@@ -1,26 +1,84 @@
-from fastapi import FastAPI, Header
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 
 from utils import SlackEvent
 from router import router
-from db import users, events, records
+from db import (users, events, records, slack_events, checkins, attendance, 
+                start_attendance, aggregates, jobs, emails, repo, fetch_all, fetch_first)
+from dispatcher import dispatcher
+from dedup import EventDeduplicator
+from slack_client import client
+from outbox import outbox
+from scheduler import Scheduler
+from router.coffee import schedule_rounds
+from router.committee import seats
+from export import iter_attendance, stream_csv, stream_parquet, require_pyarrow
+from response_cache import response_cache
+from pubsub import hub
 
-from multiprocessing import Process
+from collections import defaultdict
+import asyncio
+import json
 import time
+import os
 
 app = FastAPI(title="Momentum Slack Bot")
 
 load_dotenv()
 
+# set DEDUP_SHARED when running more than one instance of the bot
+deduplicator = EventDeduplicator(backend=slack_events if os.getenv("DEDUP_SHARED") else None)
+scheduler = Scheduler(jobs)
+
+SSE_KEEPALIVE = 15 # seconds between keepalive comments on idle streams
+
+@app.middleware("http")
+async def cache_responses(request: Request, call_next):
+    """Serve repeated GETs from the response cache, with ETag revalidation."""
+    path = request.url.path
+    if request.method != "GET" or not response_cache.cacheable(path):
+        return await call_next(request)
+
+    key = response_cache.key(path, request.url.query)
+    entry = response_cache.get(key)
+    status = "hit"
+    if entry is None:
+        status = "miss"
+        generation = response_cache.generation
+        st = time.perf_counter()
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        # keep the route's own headers (e.g. Server-Timing); the body ones
+        # are set again for the cached body
+        route_headers = [(name, value) for name, value in response.headers.items()
+                         if name not in ("content-length", "content-type", "etag")]
+        entry = response_cache.set(key, body, response.headers.get("content-type"), 
+                                   time.perf_counter() - st, generation, route_headers)
+
+    if response_cache.matches(entry, request.headers.get("if-none-match")):
+        response = Response(status_code=304)
+    else:
+        response = Response(content=entry.body, media_type=entry.media_type)
+    for name, value in entry.headers:
+        response.headers.append(name, value)
+    response.headers["ETag"] = entry.etag
+    response.headers["X-Cache"] = status
+    return response
+
 @app.get("/")
 async def root():
     return 'Welcome to the official Texas Momentum Slack Bot!'
 
 @app.post("/slack")
-async def slack_event(event: SlackEvent, header: str = Header(None)):
+async def slack_event(event: SlackEvent, 
+                      x_slack_retry_num: str = Header(None), 
+                      x_slack_retry_reason: str = Header(None)):
 
-    print(event, header)
+    print(event, x_slack_retry_num, x_slack_retry_reason)
 
     # on first run, Slack will send a challenge to verify the URL
     if event.type == 'url_verification':
@@ -31,54 +89,127 @@ async def slack_event(event: SlackEvent, header: str = Header(None)):
         print("App rate limited")
         return "HTTP 200 OK"
 
-    # if the event is a retry, don't retry
-    if header == 'HTTP_X_SLACK_RETRY_NUM':
-        print("App retried")
-        return "HTTP 201 OK"
+    # drop duplicate deliveries of events that were already taken; with
+    # DEDUP_SHARED this is a Deta call, keep it off the event loop
+    if event.event_id and await run_in_threadpool(deduplicator.seen, event.event_id):
+        print(f"Dropping duplicate event {event.event_id} (retry {x_slack_retry_num})")
+        return "HTTP 200 OK", 200
     
+    # without an event id, only retries of events we rejected are processed
+    if not event.event_id and x_slack_retry_num and x_slack_retry_reason != "http_error":
+        print("App retried")
+        return "HTTP 200 OK", 200
 
-    # route the request to the appropriate handler in a new thread
-    # NOTE: Lambda does not support multiprocessing
-    # process = Process(target=router, args=(event.event,))
-    # process.start()
-    # st = time.time()
-    router(event.event)
-    # print(time.time() - st)
+    # ack right away and route the request on the background worker pool,
+    # so slow Deta/Slack calls don't hold up Slack's 3 second deadline
+    if not dispatcher.submit(router, event.event):
+        # the pool is saturated; have Slack retry the event later
+        print("Dispatcher queue full, rejecting event")
+        if event.event_id:
+            await run_in_threadpool(deduplicator.forget, event.event_id)
+        return JSONResponse(content="HTTP 503 Busy", status_code=503)
 
     return "HTTP 200 OK", 200
 
+@app.on_event("startup")
+def startup():
+    start_attendance()
+
+    # bulk-load user profiles so check-ins don't wait on Deta for them
+    try:
+        print(f"Warmed user cache with {users.warm()} users")
+    except Exception as e:
+        print(f"Could not warm user cache: {e!r}")
+
+    schedule_rounds(scheduler)
+    scheduler.start()
+
+@app.on_event("shutdown")
+def shutdown():
+    scheduler.stop()
+    dispatcher.shutdown()
+    attendance.close()
+    outbox.drain()
+
+@app.get("/admin/metrics")
+async def get_metrics():
+    """Get internal performance metrics."""
+    return {
+        "dispatcher": dispatcher.metrics(),
+        "dedup": deduplicator.metrics(),
+        "slack": client.metrics(),
+        "outbox": outbox.metrics(),
+        "users_cache": users.stats(),
+        "events_cache": events.stats(),
+        "checkins": checkins.stats(),
+        "committee_seats": seats.stats(),
+        "attendance_writer": attendance.metrics(),
+        "jobs": scheduler.metrics(),
+        "response_cache": response_cache.stats(),
+        "pubsub": hub.stats()
+    }
+
 @app.get("/events")
-async def get_events():
+def get_events():
     """Get all events."""
-    return events.fetch().items
+    return fetch_all(events)
+
+def stream_json_list(items):
+    """Serialize a list as JSON one item at a time."""
+    yield "["
+    for i, item in enumerate(items):
+        yield ("," if i else "") + json.dumps(item)
+    yield "]"
 
 @app.get("/admin/events")
-async def get_admin_events(return_users: bool = False):
+def get_admin_events(return_users: bool = False):
     """Get all events with list of users."""
-    all_events = events.fetch().items # get all events
-    for event in all_events:
-        event['users'] = records.fetch({"event": event['key']}).items
+    timings = {}
+    st = time.perf_counter()
 
-    if not return_users:
-        return all_events
-    
+    # fetch each base once and join them in memory
+    all_events = fetch_all(events)
+    timings["events"] = time.perf_counter() - st
+
+    st = time.perf_counter()
+    event_records = defaultdict(list)
+    for record in fetch_all(records):
+        event_records[record['event']].append(record)
+    timings["records"] = time.perf_counter() - st
+
+    if return_users:
+        st = time.perf_counter()
+        all_users = {user['key']: user for user in fetch_all(users)}
+        timings["users"] = time.perf_counter() - st
+
+    st = time.perf_counter()
     for event in all_events:
-        for user in event['users']:
-            user['info'] = users.fetch({"key": user['user']}).items[0]
+        event['users'] = event_records.get(event['key'], [])
+        if return_users:
+            for user in event['users']:
+                user['info'] = all_users.get(user['user'])
+    timings["join"] = time.perf_counter() - st
 
-    return all_events
+    print(f"/admin/events timings: {timings}")
+    server_timing = ", ".join(f"{stage};dur={t * 1000:.1f}" for stage, t in timings.items())
+    return StreamingResponse(stream_json_list(all_events), 
+                             media_type="application/json",
+                             headers={"Server-Timing": server_timing})
 
 @app.get("/admin/events/{event_id}")
-async def get_events_by_id(event_id, formatted: bool = False):
+def get_events_by_id(event_id, formatted: bool = False):
     """Get the event with a list of users."""
-    event = events.fetch({"key": event_id}).items[0]
-    event['users'] = records.fetch({"event": event['key']}).items
-    for user in event['users']:
-        user['info'] = users.fetch({"key": user['user']}).items[0]
+    event = events.get(event_id)
 
     if formatted:
-        # return just the user's names in a list
-        names = [u['info']['name'] for u in event['users']]
+        # read the names from the attendance aggregate instead of rescanning
+        # records, unless the event predates the aggregates
+        summary = aggregates.event_summary(event_id)
+        if summary:
+            names = [name or "" for name in summary.get('names', [])]
+        else:
+            names = [(users.get(r['user']) or {}).get('name', "") 
+                     for r in fetch_all(records, {"event": event_id})]
         count = len(names)
         names = "<br>".join(names)
         
@@ -101,20 +232,154 @@ async def get_events_by_id(event_id, formatted: bool = False):
         """
         return HTMLResponse(content=message, status_code=200)
 
+    event['users'] = fetch_all(records, {"event": event['key']})
+    for user in event['users']:
+        user['info'] = users.get(user['user'])
+
     return event
 
+def sse(event: str, data) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def event_attendees(event_id: str) -> dict:
+    """
+    The event's attendees as {"count", "users", "names"}: the aggregate plus
+    the check-ins still waiting in the attendance journal, once per user.
+    """
+    # read the journal first: a check-in leaves it only after it's counted
+    pending = [item['user'] for item in attendance.pending() if item['event'] == event_id]
+    summary = aggregates.event_summary(event_id) or {}
+    user_ids = summary.get('users', [])
+    counted = set(user_ids)
+    new = [user_id for user_id in dict.fromkeys(pending) if user_id not in counted]
+    return {
+        "count": summary.get('count', 0) + len(new),
+        "users": user_ids + new,
+        "names": summary.get('names', []) + [(users.get(user_id) or {}).get('name') for user_id in new]
+    }
+
+@app.get("/admin/events/{event_id}/stream")
+async def stream_event(event_id: str):
+    """
+    Stream an event's check-ins as Server-Sent Events: a `snapshot` with the
+    current attendees' user ids and names, then a `checkin` message for every
+    new check-in.
+    """
+    # the route has to run on the event loop to subscribe, so the Deta calls
+    # go to the thread pool
+    event = await run_in_threadpool(events.get, event_id)
+    if event is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+
+    # subscribe before reading the snapshot so no check-in falls in between;
+    # one that lands in both is in the snapshot's `users`, for the client to skip
+    subscription = hub.subscribe(f"event:{event_id}")
+    try:
+        snapshot = await run_in_threadpool(event_attendees, event_id)
+    except Exception:
+        hub.unsubscribe(subscription)
+        raise
+
+    async def messages():
+        try:
+            yield sse("snapshot", {
+                "event": event_id, 
+                "name": event['name'], 
+                **snapshot
+            })
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.get(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                # send whatever queued up meanwhile along in the same chunk
+                batch = [message] + subscription.drain()
+                chunk = "".join(sse("checkin", m) for m in batch if m is not None)
+                if chunk:
+                    yield chunk
+                if None in batch:
+                    # dropped as a slow consumer, the client reconnects for a new snapshot
+                    return
+        finally:
+            hub.unsubscribe(subscription)
+
+    return StreamingResponse(messages(), 
+                             media_type="text/event-stream", 
+                             headers={"Cache-Control": "no-cache"})
+
 @app.get("/users/{user_email}")
-async def get_user(user_email: str):
+def get_user(user_email: str):
     """Get all events for a user by email address."""
-    user_info =  users.fetch({"email": user_email}).items
-    if len(user_info) == 0:
-        return {"error": "User not found."}, 404
+    user_id = emails.lookup(user_email)
+    user_info = users.get(user_id) if user_id else None
+    if user_info is None or (user_info.get('email') or '').lower() != user_email.lower():
+        # not indexed yet (or the index is stale), fall back to a scan
+        user_info = fetch_first(users, {"email": user_email})
+        if user_info is None:
+            return {"error": "User not found."}, 404
+        emails.set(user_email, user_info['key'])
+    user_id = user_info['key']
     
-    user_info = user_info[0]
-    user_info['events'] = records.fetch({"user": user_info['key']}).items
+    summary = aggregates.user_summary(user_id) or {}
+    user_info['attendance'] = summary.get('count', 0)
+    codes = list(dict.fromkeys(summary.get('events') or []))
+    if 'events' not in summary:
+        # the aggregate predates the attended events index
+        codes = list(dict.fromkeys(r['event'] for r in fetch_all(records, {"user": user_id})))
+
+    # get the records and the events at once, cached events locally
+    infos = {code: events.peek(code) for code in codes}
+    missing = [code for code, info in infos.items() if info is None]
+    found, fetched = repo.gather(
+        repo.get_many(repo.records, [f"{code}{user_id}" for code in codes]),
+        repo.get_many(repo.events, missing))
+    for code, info in fetched.items():
+        if info is not None:
+            events.prime(code, info)
+    infos.update(fetched)
+
+    user_info['events'] = []
+    for code in codes:
+        key = f"{code}{user_id}"
+        # check-ins still in the attendance journal have no record yet
+        record = found[key] or {"key": key, "user": user_id, "event": code}
+        record['info'] = infos[code]
+        user_info['events'].append(record)
+
+    return user_info
+
+def export_response(chunks, media_type: str, filename: str):
+    return StreamingResponse(chunks, 
+                             media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.get("/admin/export/attendance.csv")
+def export_attendance_csv(event: str = None):
+    """Stream every check-in (or one event's) as a flat CSV table."""
+    rows = iter_attendance(records, users, events, {"event": event} if event else None)
+    return export_response(stream_csv(rows), "text/csv", "attendance.csv")
 
-    # get info about the events
-    for event in user_info['events']:
-        event['info'] = events.fetch({"key": event['event']}).items[0]
+@app.get("/admin/export/attendance.parquet")
+def export_attendance_parquet(event: str = None):
+    """Stream every check-in (or one event's) as a Parquet file."""
+    try:
+        require_pyarrow()
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow installed")
+    rows = iter_attendance(records, users, events, {"event": event} if event else None)
+    return export_response(stream_parquet(rows), "application/vnd.apache.parquet", "attendance.parquet")
 
-    return user_info
\ No newline at end of file
+@app.get("/admin/leaderboard")
+def get_leaderboard(limit: int = 10):
+    """Get the users with the most event check-ins."""
+    leaders = aggregates.leaderboard(limit)
+    return [
+        {
+            "user": item['ref'], 
+            "name": (users.get(item['ref']) or {}).get('name'), 
+            "count": item['count']
+        } 
+        for item in leaders
+    ]
\ No newline at end of file
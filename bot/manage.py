@@ -0,0 +1,71 @@
+"""
+Maintenance commands. Run from the bot directory, e.g.
+
+    python manage.py rebuild-aggregates --check
+    python manage.py reindex
+    python manage.py migrate --path momentum.db
+"""
+from db import aggregates, emails, records, users, iter_fetch, BASE_NAMES
+from db.backends import open_backend, SQLITE_PATH
+import argparse
+
+MIGRATE_BATCH = 1000 # items written per put_many when migrating
+
+
+def rebuild_aggregates(args):
+    drift = aggregates.rebuild(records, users, fix=not args.check)
+    for key, (stored, actual) in sorted(drift.items()):
+        print(f"{key}: stored {stored}, actual {actual}")
+    print(f"{len(drift)} aggregates {'drifted' if args.check else 'fixed'}")
+
+
+def reindex(args):
+    print(f"{emails.rebuild(users)} users indexed by email")
+    # the attended events of each user live in the user aggregates
+    drift = aggregates.rebuild(records, users, fix=True)
+    print(f"attendance aggregates rebuilt, {len(drift)} had drifted")
+
+
+def migrate(args):
+    source = open_backend("deta")
+    target = open_backend("sqlite", args.path)
+    for name in args.bases or BASE_NAMES:
+        src, dest = source(name), target(name)
+        batch, n = [], 0
+        for item in iter_fetch(src, prefetch=True):
+            batch.append(item)
+            if len(batch) == MIGRATE_BATCH:
+                dest.put_many(batch)
+                n += len(batch)
+                batch = []
+        if batch:
+            dest.put_many(batch)
+            n += len(batch)
+        print(f"{name}: copied {n} items")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Momentum bot maintenance commands.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("rebuild-aggregates", 
+                            help="recompute the attendance aggregates from the records base")
+    p.add_argument("--check", action="store_true", help="only report drift, don't write anything")
+    p.set_defaults(func=rebuild_aggregates)
+
+    p = commands.add_parser("reindex", 
+                            help="rebuild the email and attended events indexes")
+    p.set_defaults(func=reindex)
+
+    p = commands.add_parser("migrate", 
+                            help="copy every Base from Deta into a SQLite database")
+    p.add_argument("--path", default=SQLITE_PATH, help="the SQLite database to copy into")
+    p.add_argument("bases", nargs="*", help="only copy these Bases")
+    p.set_defaults(func=migrate)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
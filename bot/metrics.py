@@ -0,0 +1,74 @@
+from collections import deque
+from threading import Lock
+
+
+class Summary:
+    """
+    Keeps a rolling window of observations (e.g. latencies in seconds) and
+    reports simple percentiles over it. Safe to use from multiple threads.
+    """
+
+    def __init__(self, window: int = 1000):
+        self._samples = deque(maxlen=window)
+        self._count = 0
+        self._total = 0.0
+        self._lock = Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._samples.append(value)
+            self._count += 1
+            self._total += value
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict: count and mean over all observations, plus p50/p95/max over
+                the rolling window
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total = self._count, self._total
+
+        if not samples:
+            return {"count": count, "mean": None, "p50": None, "p95": None, "max": None}
+
+        return {
+            "count": count,
+            "mean": round(total / count, 6),
+            "p50": round(samples[len(samples) // 2], 6),
+            "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 6),
+            "max": round(samples[-1], 6)
+        }
+
+
+class Histogram:
+    """
+    Counts observations into fixed cumulative buckets (Prometheus style),
+    e.g. for job runtimes in seconds.
+    """
+
+    def __init__(self, buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300)):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+            else:
+                self._counts[-1] += 1
+            self._sum += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative, buckets = 0, {}
+        for bound, n in zip(self.buckets + ("+Inf",), counts):
+            cumulative += n
+            buckets[str(bound)] = cumulative
+        return {"buckets": buckets, "count": cumulative, "sum": round(total, 6)}
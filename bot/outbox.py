@@ -0,0 +1,270 @@
+from concurrent.futures import Future
+from collections import deque
+from dotenv import load_dotenv
+from threading import Thread, Condition, Lock
+from slack_client import client, RateLimited, SlackError
+from metrics import Summary
+import random
+import time
+import os
+
+load_dotenv()
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 4))
+OUTBOX_MAX_PENDING = int(os.getenv("OUTBOX_MAX_PENDING", 1000))
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 0.5 # seconds; doubled on every attempt, with full jitter
+BURST_SECONDS = 10 # method buckets may burst up to this many seconds of calls
+
+# Slack rate tiers in calls per minute, see https://api.slack.com/docs/rate-limits
+TIER_RATES = {1: 1, 2: 20, 3: 50, 4: 100}
+METHOD_TIERS = {
+    "chat.postEphemeral": 4,
+    "conversations.members": 4,
+    "users.profile.get": 4,
+    "conversations.open": 3
+}
+DEFAULT_TIER = 3
+# read methods don't take JSON bodies, their arguments go in the query string
+QUERY_METHODS = {"conversations.members", "users.profile.get"}
+# chat.postMessage is special-tier: about one message per second per channel
+PER_CHANNEL_RATE = {"chat.postMessage": 1}
+# posting isn't idempotent: a call that failed after Slack accepted it would
+# post twice if retried, so these are only retried when Slack refused them
+NOT_RETRIED = {"chat.postMessage", "chat.postEphemeral"}
+
+
+class TokenBucket:
+    """
+    Token bucket that refills at `rate` tokens per second up to `burst`.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available, 0 if one is available now."""
+        with self._lock:
+            self._refill()
+            return 0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def take(self):
+        """Take a token; check `delay` first."""
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+
+    def pause(self, seconds: float):
+        """Empty the bucket so no tokens are handed out for `seconds`."""
+        with self._lock:
+            self._tokens = -seconds * self.rate
+            self._updated = time.monotonic()
+
+
+class Message:
+    def __init__(self, method: str, data: dict, channel: str, priority: bool = False):
+        self.method = method
+        self.data = data
+        self.channel = channel
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.not_before = 0 # monotonic time before which it mustn't be sent
+        self.attempts = 0
+        self.future = Future()
+
+
+class Outbox:
+    """
+    Outbound Slack scheduler. Calls are queued per channel and the channels
+    are served round-robin, one call at a time each, so a burst in one
+    channel keeps its order without starving the others. A call is only
+    handed to a worker once the token bucket of its method's rate tier has a
+    token, so workers never sleep on a bucket while calls of other methods
+    could go out; calls someone waits on (`call`) go before fire-and-forget
+    ones. 429s pause the bucket for the Retry-After period, and failed calls
+    are put back in line a bounded number of times with jittered exponential
+    backoff (posts only after a 429, see NOT_RETRIED).
+    """
+
+    def __init__(self, workers: int = OUTBOX_WORKERS, max_pending: int = OUTBOX_MAX_PENDING):
+        self.max_pending = max_pending
+        self._queues = {} # channel -> deque of pending messages
+        self._ready = deque() # channels with pending messages and no worker
+        self._pending = 0
+        self._cond = Condition()
+        self._buckets = {}
+        self._buckets_lock = Lock()
+
+        self.send_latency = Summary()
+        self.sent = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.dropped = 0
+
+        for i in range(workers):
+            Thread(target=self._work, name=f"outbox-{i}", daemon=True).start()
+
+    def enqueue(self, method: str, data: dict, channel: str = None, priority: bool = False) -> Future:
+        """
+        Queue a Web API call.
+        Args:
+            method (str): Web API method, e.g. "chat.postEphemeral"
+            data (dict): arguments of the call
+            channel (str): channel the call is about, used for fairness and
+                per-channel rate limits (defaults to data["channel"])
+            priority (bool): send before calls without priority
+        Returns:
+            Future: resolves to the Slack response, or to the error if the
+                call was dropped
+        """
+        msg = Message(method, data, channel or data.get("channel") or method, priority)
+        with self._cond:
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                msg.future.set_exception(SlackError(f"{method} dropped: outbox full"))
+                return msg.future
+
+            q = self._queues.get(msg.channel)
+            if q is None:
+                q = self._queues[msg.channel] = deque()
+                self._ready.append(msg.channel)
+            q.append(msg)
+            self._pending += 1
+            self._cond.notify()
+        return msg.future
+
+    def call(self, method: str, data: dict, channel: str = None, timeout: float = 60) -> dict:
+        """
+        Queue a Web API call ahead of fire-and-forget ones and wait for its
+        response.
+        Raises:
+            concurrent.futures.TimeoutError: if there's no response in time
+            SlackError: if the call failed
+        """
+        return self.enqueue(method, data, channel, priority=True).result(timeout)
+
+    def _next(self):
+        """
+        Take the first message that may be sent now, priority ones first;
+        called with the condition held.
+        Returns:
+            tuple: (message, None), or (None, seconds until one may be sent,
+                or None if nothing is queued)
+        """
+        now = time.monotonic()
+        wait = None
+        ready = sorted(self._ready, key=lambda channel: not self._queues[channel][0].priority)
+        for channel in ready:
+            msg = self._queues[channel][0]
+            buckets = self._buckets_for(msg)
+            delay = max([msg.not_before - now] + [bucket.delay() for bucket in buckets])
+            if delay <= 0:
+                self._ready.remove(channel)
+                self._queues[channel].popleft()
+                for bucket in buckets:
+                    bucket.take()
+                return msg, None
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _work(self):
+        while True:
+            with self._cond:
+                msg, wait = self._next()
+                while msg is None:
+                    self._cond.wait(wait)
+                    msg, wait = self._next()
+
+            retry = self._send(msg)
+
+            with self._cond:
+                q = self._queues[msg.channel]
+                if retry:
+                    q.appendleft(msg) # keep the channel's order
+                else:
+                    self._pending -= 1
+                if q:
+                    self._ready.append(msg.channel)
+                    self._cond.notify()
+                else:
+                    del self._queues[msg.channel]
+
+    def _bucket(self, key, rate_per_sec: float, burst: float = 1) -> TokenBucket:
+        with self._buckets_lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(rate_per_sec, burst)
+            return self._buckets[key]
+
+    def _buckets_for(self, msg: Message) -> list:
+        """The token buckets a message has to take from, narrowest last."""
+        tier = METHOD_TIERS.get(msg.method, DEFAULT_TIER)
+        rate = TIER_RATES[tier] / 60
+        buckets = [self._bucket(msg.method, rate, max(1, rate * BURST_SECONDS))]
+        if msg.method in PER_CHANNEL_RATE:
+            buckets.append(self._bucket((msg.method, msg.channel), PER_CHANNEL_RATE[msg.method]))
+        return buckets
+
+    def _send(self, msg: Message) -> bool:
+        """
+        Make the call and resolve its future.
+        Returns:
+            bool: True if it failed and should be put back in line
+        """
+        retryable = True
+        try:
+            if msg.method in QUERY_METHODS:
+                r = client.api_call(msg.method, params=msg.data)
+            else:
+                r = client.api_call(msg.method, json=msg.data)
+        except RateLimited as e:
+            self.rate_limited += 1
+            self._buckets_for(msg)[-1].pause(e.retry_after)
+            error = e
+        except SlackError as e:
+            error = e
+            retryable = msg.method not in NOT_RETRIED
+            msg.not_before = time.monotonic() + random.uniform(0, BACKOFF_BASE * 2 ** msg.attempts)
+        else:
+            self.sent += 1
+            self.send_latency.observe(time.monotonic() - msg.enqueued)
+            msg.future.set_result(r)
+            return False
+
+        msg.attempts += 1
+        if retryable and msg.attempts < MAX_ATTEMPTS:
+            self.retries += 1
+            return True
+
+        self.dropped += 1
+        print(f"Outbox: giving up on {msg.method} to {msg.channel}: {error}")
+        msg.future.set_exception(error)
+        return False
+
+    def drain(self, timeout: float = 10):
+        """Wait up to `timeout` seconds for queued calls to go out."""
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def metrics(self) -> dict:
+        return {
+            "queue_depth": self._pending,
+            "channels": len(self._queues),
+            "sent": self.sent,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "dropped": self.dropped,
+            "send_latency": self.send_latency.snapshot()
+        }
+
+
+outbox = Outbox()
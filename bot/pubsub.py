@@ -0,0 +1,124 @@
+from threading import Lock
+import asyncio
+
+CLOSED = object()
+
+
+class Subscription:
+    """
+    A subscriber's bounded buffer of messages on a topic. Messages are
+    delivered on the event loop the subscription was made on; if the buffer
+    is full the subscriber is too slow and is dropped, and `get` returns None.
+    """
+
+    def __init__(self, hub: "PubSub", topic: str, size: int):
+        self.hub = hub
+        self.topic = topic
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(size)
+        self.dropped = False
+
+    def _deliver(self, message):
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped = True
+            self.hub.unsubscribe(self, dropped=True)
+            # make room for the sentinel, the pending messages are lost anyway
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(CLOSED)
+
+    async def get(self):
+        """Wait for the next message; None once the subscriber was dropped."""
+        message = await self.queue.get()
+        return None if message is CLOSED else message
+
+    def drain(self) -> list:
+        """Take the messages already waiting, without blocking; None marks a drop."""
+        messages = []
+        while not self.queue.empty():
+            message = self.queue.get_nowait()
+            messages.append(None if message is CLOSED else message)
+        return messages
+
+
+class PubSub:
+    """
+    In-process publish/subscribe hub, so one published message fans out to
+    every open stream instead of each stream polling the Base. `publish` can
+    be called from any thread; each subscriber gets the message through its
+    own bounded buffer on its event loop, so a slow subscriber never holds up
+    the publisher or the others. Only sees messages published by this
+    instance of the bot.
+    Args:
+        buffer_size (int): messages buffered per subscriber before it is
+            dropped as too slow
+    """
+
+    def __init__(self, buffer_size: int = 100):
+        self.buffer_size = buffer_size
+        self._topics = {} # topic -> set of subscriptions
+        self._lock = Lock()
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, topic: str) -> Subscription:
+        """Subscribe to a topic; must be called from a running event loop."""
+        sub = Subscription(self, topic, self.buffer_size)
+        with self._lock:
+            self._topics.setdefault(topic, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription, dropped: bool = False):
+        with self._lock:
+            self.dropped += dropped
+            subs = self._topics.get(sub.topic)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._topics[sub.topic]
+
+    def publish(self, topic: str, message) -> int:
+        """
+        Send a message to every subscriber of a topic.
+        Returns:
+            int: number of subscribers it was sent to
+        """
+        with self._lock:
+            subs = list(self._topics.get(topic, ()))
+            self.published += 1
+            self.delivered += len(subs)
+
+        # one wakeup per event loop rather than per subscriber
+        by_loop = {}
+        for sub in subs:
+            by_loop.setdefault(sub.loop, []).append(sub)
+        for loop, loop_subs in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(self._deliver, loop_subs, message)
+            except RuntimeError:
+                for sub in loop_subs:
+                    self.unsubscribe(sub) # its loop is gone
+        return len(subs)
+
+    @staticmethod
+    def _deliver(subs: list, message):
+        for sub in subs:
+            sub._deliver(message)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "topics": len(self._topics),
+                "subscribers": sum(len(subs) for subs in self._topics.values()),
+                "published": self.published,
+                "delivered": self.delivered,
+                "dropped": self.dropped
+            }
+
+
+hub = PubSub()
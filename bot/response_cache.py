@@ -0,0 +1,128 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import NamedTuple, Optional
+from urllib.parse import parse_qsl, urlencode
+from dotenv import load_dotenv
+import hashlib
+import time
+import os
+
+load_dotenv()
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 30))
+MAX_ENTRY_BYTES = 5 * 1024 * 1024 # larger responses aren't cached
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    media_type: Optional[str]
+    etag: str
+    expires: float
+    cost: float # seconds it took to build the response
+    headers: tuple = () # (name, value) pairs the route set, sent back on hits
+
+
+class ResponseCache:
+    """
+    Caches the bodies of GET responses, keyed by path and query string, with
+    an ETag per body so clients can revalidate with If-None-Match. Entries
+    expire after `ttl` seconds and are dropped early by `invalidate` when the
+    write paths change what a route returns. A response built while an
+    invalidation happened is not stored, so it can't outlive the change.
+    Args:
+        ttl (float): seconds a response may be served from the cache
+        max_size (int): maximum number of cached responses
+        exclude (tuple): path prefixes that are never cached
+        exclude_suffixes (tuple): path suffixes that are never cached, e.g.
+            of endless streams
+    """
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_size: int = 256,
+                 exclude: tuple = ("/admin/export", "/admin/metrics"),
+                 exclude_suffixes: tuple = ("/stream",)):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.exclude = exclude
+        self.exclude_suffixes = exclude_suffixes
+        self.generation = 0 # bumped by every invalidation
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.time_saved = 0.0
+
+    def cacheable(self, path: str) -> bool:
+        return (self.ttl > 0 and not path.startswith(self.exclude)
+                and not path.endswith(self.exclude_suffixes))
+
+    @staticmethod
+    def key(path: str, query: str) -> str:
+        """Cache key of a request; the order of query parameters doesn't matter."""
+        return f"{path}?{urlencode(sorted(parse_qsl(query, keep_blank_values=True)))}"
+
+    @staticmethod
+    def etag(body: bytes) -> str:
+        return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.time_saved += entry.cost
+            return entry
+
+    def set(self, key: str, body: bytes, media_type: str, cost: float,
+            generation: int, headers: tuple = ()) -> CachedResponse:
+        """
+        Store a response built since `generation` was read; it is only
+        cached if nothing was invalidated in the meantime.
+        """
+        entry = CachedResponse(body, media_type, self.etag(body), time.monotonic() + self.ttl, 
+                               cost, tuple(headers))
+        with self._lock:
+            if generation == self.generation and len(body) <= MAX_ENTRY_BYTES:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def matches(self, entry: CachedResponse, if_none_match: Optional[str]) -> bool:
+        """Whether the client's If-None-Match header covers this response."""
+        if not if_none_match:
+            return False
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if entry.etag in tags or "*" in tags:
+            with self._lock:
+                self.not_modified += 1
+            return True
+        return False
+
+    def invalidate(self, *prefixes: str):
+        """Drop the cached responses under any of the path prefixes, or all."""
+        with self._lock:
+            self.generation += 1
+            for key in list(self._entries):
+                if not prefixes or key.startswith(prefixes):
+                    del self._entries[key]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "time_saved": round(self.time_saved, 6)
+        }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,45 @@
+from threading import Lock
+from db import iter_fetch
+import random
+import os
+
+CODES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "codes.txt")
+
+
+class CodeAllocator:
+    """
+    Hands out event codes that aren't in use yet. The word list is read once;
+    on first use the codes already taken in the events base are removed from
+    a shuffled free list, and each allocation pops from it in O(1). Once every
+    word is used, two-word codes like `abacus-ablaze` are handed out instead.
+    Args:
+        base (deta.Base): the events base, keyed by code
+        path (str): the word list, one code per line
+    """
+
+    def __init__(self, base, path: str = CODES_FILE):
+        self.base = base
+        with open(path) as f:
+            self.words = [line.strip() for line in f if line.strip()]
+        self._free = None
+        self._used = set()
+        self._lock = Lock()
+
+    def _load(self):
+        self._used = {item["key"] for item in iter_fetch(self.base)}
+        self._free = [word for word in self.words if word not in self._used]
+        random.shuffle(self._free)
+
+    def allocate(self) -> str:
+        with self._lock:
+            if self._free is None:
+                self._load()
+            if self._free:
+                code = self._free.pop()
+            else:
+                code = f"{random.choice(self.words)}-{random.choice(self.words)}"
+                while code in self._used:
+                    code = f"{random.choice(self.words)}-{random.choice(self.words)}"
+            self._used.add(code)
+            return code
+
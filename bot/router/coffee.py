@@ -1,91 +1,131 @@
 from dotenv import load_dotenv
 import os
-import requests
-import random
+import time
+import secrets
+from concurrent.futures import ThreadPoolExecutor
 from utils import send_message
+from outbox import outbox
 from typing import List
-from .user import check_admin, register_user
-from db import users
+from .user import register_user
+from .matching import PairHistory, MATCHERS
+from .dms import deliver_round
+from db import users, coffee_history, coffee_rounds, iter_fetch
+from db.cache import TTLCache, MISS
 from datetime import datetime as dt
 
 load_dotenv()
 
 CHANNEL = os.getenv("COFFEE_CHANNEL")
-LIMIT_USERS = 40
+MEMBERS_PAGE_SIZE = 500
+MEMBERS_CACHE_TTL = 120 # seconds channel membership is reused for
 COFFEE_TIME = "Friday 4 pm at Medici"
 HELP_CONTACT = "U04LRHRBGHF" # Riya Kohli
 BOT_ID = "U05L20ULXPY" # bot user id
+COFFEE_MATCHER = os.getenv("COFFEE_MATCHER", "history") # see matching.MATCHERS
+MATCH_TIME_BUDGET = 2 # seconds the matcher may spend on a round
+# cron specs (in SCHEDULE_TZ) for scheduled rounds; e.g. prepare Friday at
+# 3 pm and post at 3:30 pm with "0 15 * * 5" and "30 15 * * 5"
+COFFEE_PREPARE_SCHEDULE = os.getenv("COFFEE_PREPARE_SCHEDULE")
+COFFEE_POST_SCHEDULE = os.getenv("COFFEE_POST_SCHEDULE")
+PREPARED_ROUND = "next" # key of the prepared round in coffee_rounds
+LAST_ROUND = "last" # key of the last posted round in coffee_rounds
+PREPARED_MAX_AGE = 2 * 86400 # seconds before prepared pairs are redone
+PUBLISH_LOCK = "publishing" # key held in coffee_rounds while a round is posted
+PUBLISH_LOCK_TTL = 1800 # seconds before a crashed publish stops blocking others
+COFFEE_OUT_DURATION = 604800 # seconds a `coffee out` lasts
+
+members_cache = TTLCache(ttl=MEMBERS_CACHE_TTL, max_size=20)
+
+def load_user_rows(stats: dict = None) -> dict:
+    # load every user row in one paginated pass instead of a get per member
+    return {item["key"]: item for item in iter_fetch(users, stats=stats)}
+
+def filter_users(users_list: List[str], filter_admins=True, 
+                 rows: dict = None, stats: dict = None) -> List[str]:
+    st = time.perf_counter()
+    if stats is None:
+        stats = {}
+    if rows is None:
+        rows = load_user_rows(stats)
 
-def filter_users(users_list: List[str], filter_admins=True) -> List[str]:
     # remove admins
     ret = []
     if filter_admins:
-        ret = [user for user in users_list if not check_admin(user)]
+        ret = [user for user in users_list if not rows.get(user, {}).get("admin")]
     else:
         ret = users_list
 
-    # check if user has opted out of coffee within a week ago
-    # as well as performing updates to the coffee field (expires if more than a week ago)
+    # check if user has opted out of coffee within a week ago; an opt-out
+    # simply lapses after a week, so nothing is written back (`coffee out`
+    # sets both fields again)
     ret_new = []
+    now = dt.now().timestamp()
     for user in ret:
-        user_item = users.get(user)
+        user_item = rows.get(user)
 
         if not user_item: # if the user doesn't exist in the database
             ret_new.append(user)
             continue
 
-        coffee = user_item.get("coffee")
-        if coffee:
+        if user_item.get("coffee"):
             ret_new.append(user)
             continue
-        else:
-            out_time = user_item.get("coffee_out_time") 
-
-            # if no out time exists, they should be signed up
-            if not out_time: 
-                users.update({"coffee": True}, user)
-                ret_new.append(user)
-                continue
-            
-            # otherwise, if the out time was more than a week ago, sign them up
-            if dt.now().timestamp() - out_time > 604800:
-                users.update({"coffee": True}, user)
-                ret_new.append(user)
 
+        # if no out time exists, or it was more than a week ago, they're signed up
+        out_time = user_item.get("coffee_out_time")
+        if not out_time or now - out_time > COFFEE_OUT_DURATION:
+            ret_new.append(user)
+
+    print(f"filter_users: {len(ret_new)} of {len(users_list)} users eligible, "
+          f"{stats.get('calls', 0)} DB calls in {time.perf_counter() - st:.2f}s")
     return ret_new
 
 
+def iter_members(channel_id: str):
+    # follow conversations.members cursors so large channels aren't truncated
+    cursor = None
+    while True:
+        data = {
+            "channel": channel_id,
+            "limit": MEMBERS_PAGE_SIZE
+        }
+        if cursor:
+            data["cursor"] = cursor
+        r = outbox.call("conversations.members", data)
+        if not r.get("ok"):
+            raise ValueError(r.get("error"))
+        yield from r["members"]
+
+        cursor = r.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            return
+
+def get_members(channel_id: str) -> List[str]:
+    members = members_cache.get(channel_id)
+    if members is MISS:
+        members = list(iter_members(channel_id))
+        members_cache.set(channel_id, members)
+    return list(members)
+
 def get_users(channel_id: str) -> List[str]:
-    headers = {
-        "Authorization": f"Bearer {os.getenv('SLACK_BOT_TOKEN')}"
-    }
-    
-    data = {
-        "Content-Type": "application/json",
-        "channel": channel_id,
-        "limit": LIMIT_USERS
-    }
-    r = requests.get("https://slack.com/api/conversations.members", params=data, headers=headers)
-    members = r.json()["members"]
+    # page through the channel on Slack while the user rows load from Deta
+    stats = {}
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        rows = pool.submit(load_user_rows, stats)
+        members = get_members(channel_id)
+        rows = rows.result()
 
     # remove bot user
-    members.remove(BOT_ID)
+    members = [member for member in members if member != BOT_ID]
 
-    members = filter_users(members, filter_admins=False)
+    members = filter_users(members, filter_admins=False, rows=rows, stats=stats)
     return members # TODO add blacklist filtering
 
-def make_pairs(users: List[str]) -> List[List[str]]:
-    # make random pairs of users
+def make_pairs(users: List[str], history: PairHistory = None) -> List[List[str]]:
+    # make pairs of users, avoiding repeats of previous rounds' pairs
     # if there is an odd number of users, make a group of 3
-    random.shuffle(users)
-    pairs = []
-    while len(users) > 0:
-        if len(users) == 3:
-            pairs.append(users)
-            break
-        pairs.append(users[:2])
-        users = users[2:]
-    return pairs
+    matcher = MATCHERS[COFFEE_MATCHER]
+    return matcher(users, history or PairHistory(), budget=MATCH_TIME_BUDGET)
 
 def post_matches(channel_id: str, pairs: List[List[str]]):
     match_message = "*Matches for this week:*\n"
@@ -129,60 +169,139 @@ def post_matches(channel_id: str, pairs: List[List[str]]):
 
 
     data = {
-        "Content-Type": "application/json",
         "channel": channel_id,
         "text": ":coffee: Coffee matches for this week are in! :coffee:",
         "blocks": blocks
     }
-    headers = {
-        "Authorization": f"Bearer {os.getenv('SLACK_BOT_TOKEN')}"
-    }
-    r = requests.post("https://slack.com/api/chat.postMessage", json=data, headers=headers)
-    if r.json().get('error'):
-        raise Exception(r.json().get('error'))
+    r = outbox.call("chat.postMessage", data)
+    if r.get('error'):
+        raise Exception(r.get('error'))
     
-def coffee_create(event, text):
-    if not check_admin(event.user):
-        send_message(event, body="You do not have permission to use this command.", error=True)
-        return "Error: Unauthorized", 400
+def prepare_round(channel_id: str) -> List[List[str]]:
+    # fetch, filter and pair the channel's members ahead of posting, and keep
+    # the pairs for publish_round
+    channel_users: List[str] = get_users(channel_id)
+    print(f"Successfully fetched {len(channel_users)} users from <#{channel_id}>")
+
+    pairs = []
+    if len(channel_users) >= 2:
+        st = time.perf_counter()
+        history = PairHistory.load(coffee_history)
+        pairs = make_pairs(channel_users, history)
+        repeats = sum(1 for pair in pairs if history.cost(pair) > 0)
+        print(f"Successfully made {len(pairs)} pairs ({repeats} repeats) in {time.perf_counter() - st:.2f}s")
+
+    coffee_rounds.put({"channel": channel_id, "pairs": pairs, "prepared_at": dt.now().timestamp()}, 
+                      PREPARED_ROUND)
+    return pairs
 
+def publish_round(channel_id: str, fresh: bool = False) -> dict:
+    # post the prepared pairs, preparing them now if there are none (or they
+    # are stale, or `fresh` is set), remember them for future matching and DM
+    # every pair; returns {"busy": True} if another round is being posted
+
+    # take the publish lock first: the scheduled post and an admin's `coffee
+    # create` (or another instance) would otherwise post the same round twice
+    try:
+        coffee_rounds.insert({"started_at": dt.now().timestamp()}, PUBLISH_LOCK, 
+                             expire_in=PUBLISH_LOCK_TTL)
+    except Exception as e:
+        if "already exists" not in str(e):
+            raise
+        print("Coffee: another round is being published, skipping")
+        return {"pairs": [], "busy": True}
+
+    try:
+        prepared = None if fresh else coffee_rounds.get(PREPARED_ROUND)
+        if (not prepared or prepared.get("channel") != channel_id 
+                or dt.now().timestamp() - prepared.get("prepared_at", 0) > PREPARED_MAX_AGE):
+            pairs = prepare_round(channel_id)
+        else:
+            pairs = prepared["pairs"]
+
+        if not pairs:
+            return {"pairs": pairs}
+
+        post_matches(channel_id, pairs)
+        PairHistory.load(coffee_history).save(coffee_history, pairs)
+        coffee_rounds.delete(PREPARED_ROUND)
+
+        # unique even for two rounds in the same minute, which mustn't share DM progress
+        round_id = f"{dt.now().strftime('%Y-%m-%d-%H%M')}-{secrets.token_hex(3)}"
+        coffee_rounds.put({"round": round_id, "channel": channel_id, "pairs": pairs}, LAST_ROUND)
+    finally:
+        coffee_rounds.delete(PUBLISH_LOCK)
+
+    # DMs are resumable per round, they needn't hold the lock
+    report = deliver_round(round_id, pairs, compose_dm)
+    return {"round": round_id, "pairs": pairs, "delivery": report}
+
+def compose_dm(pair: List[str]) -> str:
+    others = ", ".join(f"<@{user}>" for user in pair)
+    return (f"Hi {others}! :coffee: You've been matched for coffee this week. "
+            f"Make sure you can all make it at *{COFFEE_TIME}*, or find another time to meet.")
+
+def delivery_summary(report: dict) -> str:
+    summary = f"Sent {report['sent']} of {report['pairs']} DMs"
+    if report['skipped']:
+        summary += f" ({report['skipped']} already sent)"
+    if report['failed']:
+        summary += f", {len(report['failed'])} failed; run `coffee dms` to retry them"
+    if report['unconfirmed']:
+        summary += (f", {len(report['unconfirmed'])} unconfirmed (Slack didn't answer in time; "
+                    f"they aren't retried, so they aren't messaged twice)")
+    return summary + "."
+
+def schedule_rounds(scheduler):
+    # run coffee rounds on a schedule instead of waiting for `coffee create`
+    if not COFFEE_POST_SCHEDULE:
+        return
+    channel_name, channel_id = CHANNEL.split(":")
+    if COFFEE_PREPARE_SCHEDULE:
+        scheduler.add("coffee-prepare", COFFEE_PREPARE_SCHEDULE, 
+                      lambda: prepare_round(channel_id), catch_up=True)
+    scheduler.add("coffee-post", COFFEE_POST_SCHEDULE, 
+                  lambda: publish_round(channel_id), misfire_grace=3600)
+
+def coffee_create(event):
     channel_name, channel_id = CHANNEL.split(":")
 
     try:
-        channel_users: List[str] = get_users(channel_id)
-        print(f"Successfully fetched {len(channel_users)} users from {channel_name} channel")
+        published = publish_round(channel_id, fresh=True)
     except ValueError:
         send_message(event, body=f"Sorry, I'm not invited to that channel.", error=True)
         return "Error: Invalid channel", 400
 
-    if len(channel_users) < 2:
+    if published.get("busy"):
+        send_message(event, body="A coffee round is being posted right now. Try again in a few minutes.", 
+                     error=True)
+        return "Error: Round in progress", 409
+
+    pairs = published["pairs"]
+    if not pairs:
         send_message(event, body=f"Not enough users to make pairs in the channel <#{channel_id}>.")
         return
 
-    pairs = make_pairs(channel_users)
-    print(f"Successfully made {len(pairs)} pairs")
-    post_matches(channel_id, pairs)
+    send_message(event, body=f"Successfully made {len(pairs)} pairs in the channel <#{channel_id}>. "
+                             f"{delivery_summary(published['delivery'])}")
 
-    send_message(event, body=f"Successfully made {len(pairs)} pairs in the channel <#{channel_id}>.")
-    # TODO add functionality to send dms to users
+    return "Success", 200
+
+def coffee_dms(event):
+    # resume sending the last round's DMs, skipping pairs already reached
+    last = coffee_rounds.get(LAST_ROUND)
+    if not last:
+        send_message(event, body="There is no coffee round to send DMs for.", error=True)
+        return "Error: No round", 400
 
+    report = deliver_round(last["round"], last["pairs"], compose_dm)
+    send_message(event, body=delivery_summary(report))
     return "Success", 200
 
-def coffee_out(event, text):
+def coffee_out(event):
     # mark user as opting out of coffee and note the time
     user_id = event.user
     register_user(event, send_msg=False)
     users.update({"coffee": False, "coffee_out_time": dt.now().timestamp()}, user_id)
     send_message(event, body="You have opted out of coffee for this week.")
     return "Success", 200
-
-def handle_coffee(event, text):
-    subcommand = text[1].lower()
-    if subcommand == "create":
-        return coffee_create(event, text)
-    elif subcommand == "out":
-        return coffee_out(event, text)
-    else:
-        send_message(event, body="Invalid subcommand.", error=True)
-        return "Error: Invalid subcommand", 400
-
@@ -1,6 +1,6 @@
-from db import users, committees
+from db import users, committees, committee_seats, iter_fetch
+from db.seats import SeatAllocator
 from utils import EventInfo, send_message
-from typing import List
 from .user import register_user
 
 COMMITTEES = {
@@ -9,20 +9,23 @@ COMMITTEES = {
     "partners": 5
 }
 
-def handle_committee(event: EventInfo, text: List[str]):
+# seats make the capacity check atomic; members who joined before seats
+# existed are given one on the first reconcile
+seats = SeatAllocator(
+    committee_seats, 
+    COMMITTEES, 
+    members_of=lambda c: [m["key"] for m in iter_fetch(committees, {"committee": c})])
+
+def committee_join(event: EventInfo, name: str):
     """
-    Handle committee subcommand.
+    Join a committee, if it isn't full.
     Args:
         event (EventInfo): EventInfo object describing the event
-        text (List[str]): List of parsed words in the command
+        name (str): The committee name
     Returns:
         Error 400 or HTTP 200 OK
     """
-
-    if len(text) == 1:
-        return "Error: No subcommand provided", 400
-    
-    c = text[1].lower()
+    c = name.lower()
 
     if c not in COMMITTEES.keys():
         send_message(event, 
@@ -42,17 +45,18 @@ def handle_committee(event: EventInfo, text: List[str]):
                      body="You are already in this committee.")
         return "Already in committee", 200
     
-    # check the number of committee c that already exist in the db
-    num_c = committees.fetch({"committee": c}).count
-    if num_c >= COMMITTEES[c]:
+    # take a seat in committee c, unless it's full
+    if not seats.reserve(c, user_id):
         send_message(event, 
                      header="Committee full",
                      body=f"Sorry, the maximum number of members for that committee has been reached.",
                      error=True)
         return "Committee full", 200
     else:
-        # update the user's committee in the db
-        committees.put({"committee": c, "name": user.get("name")}, user_id)
+        # update the user's committee in the db and free their old seat
+        committees.put({"committee": c, "name": (user or {}).get("name")}, user_id)
+        if u is not None and u.get("committee") in COMMITTEES:
+            seats.release(u.get("committee"), user_id)
         send_message(event, 
                      header="Success!",
                      body=f"You have been added to the {c} committee.")
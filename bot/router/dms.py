@@ -0,0 +1,123 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime as dt
+from typing import List
+from db import coffee_dms, iter_fetch
+from outbox import outbox
+import time
+
+DM_CONCURRENCY = 8 # pairs being messaged at once
+
+
+def pair_key(pair: List[str]) -> str:
+    return "-".join(sorted(pair))
+
+
+class DMRejected(Exception):
+    """Slack answered a DM call with `ok: false`, so nothing was posted."""
+
+
+def open_group_dm(users: List[str]) -> str:
+    """
+    Open (or reuse) the group DM between some users.
+    Args:
+        users (List[str]): Slack user IDs
+    Returns:
+        str: the DM channel id
+    """
+    r = outbox.call("conversations.open", {"users": ",".join(users)})
+    if not r.get("ok"):
+        raise DMRejected(r.get("error"))
+    return r["channel"]["id"]
+
+
+def post_dm(channel: str, text: str):
+    """
+    Post a message in a DM channel.
+    Raises:
+        DMRejected: if Slack refused the message
+        concurrent.futures.TimeoutError, SlackError: if it's unknown whether
+            the message went out; it may still be queued in the outbox
+    """
+    r = outbox.call("chat.postMessage", {"channel": channel, "text": text})
+    if not r.get("ok"):
+        raise DMRejected(r.get("error"))
+
+
+def deliver_round(round_id: str, pairs: List[List[str]], compose) -> dict:
+    """
+    Send every pair of a coffee round its own group DM, a bounded number of
+    pairs at a time; the outbox paces the calls to Slack's rate limits.
+    A pair is marked "sending" in coffee_dms before its DM goes out and
+    "sent" after. It is only marked "failed", and retried by calling this
+    again for the same round, when the DM certainly didn't go out: opening
+    the DM failed, or Slack refused the message. A pair left "sending" (the
+    post timed out, so it may still go out, or recording it failed) is
+    reported as unconfirmed and never messaged twice.
+    Args:
+        round_id (str): id of the round
+        pairs (List[List[str]]): the round's pairs
+        compose (callable): returns the message text for a pair
+    Returns:
+        dict: delivery report with sent/skipped counts, failures, pairs
+            whose delivery couldn't be confirmed, and throughput
+    """
+    st = time.perf_counter()
+    started = {item["pair"] for item in iter_fetch(coffee_dms, [
+        {"round": round_id, "status": "sent"}, 
+        {"round": round_id, "status": "sending"}
+    ])}
+    todo = [pair for pair in pairs if pair_key(pair) not in started]
+    unconfirmed = []
+
+    def deliver(pair):
+        key = f"{round_id}:{pair_key(pair)}"
+
+        def failed(e):
+            coffee_dms.put({"round": round_id, "pair": pair_key(pair), "status": "failed", 
+                            "error": str(e)}, key)
+
+        # if this fails, nothing was sent and the pair can safely be retried
+        coffee_dms.put({"round": round_id, "pair": pair_key(pair), "status": "sending"}, key)
+        try:
+            channel = open_group_dm(pair)
+        except Exception as e:
+            failed(e) # nothing was posted yet
+            raise
+        try:
+            post_dm(channel, compose(pair))
+        except DMRejected as e:
+            failed(e)
+            raise
+        except Exception as e:
+            # the message may still go out; leave the pair "sending"
+            print(f"Coffee DMs: delivery to {pair_key(pair)} unconfirmed: {e!r}")
+            unconfirmed.append(pair_key(pair))
+            return
+        try:
+            coffee_dms.put({"round": round_id, "pair": pair_key(pair), "status": "sent", 
+                            "channel": channel, "sent_at": dt.now().timestamp()}, key)
+        except Exception as e:
+            # the DM is out; the pair stays "sending" and won't be retried
+            print(f"Coffee DMs: could not record delivery to {pair_key(pair)}: {e!r}")
+
+    failed = {}
+    with ThreadPoolExecutor(max_workers=DM_CONCURRENCY) as pool:
+        futures = {pool.submit(deliver, pair): pair for pair in todo}
+        for future in as_completed(futures):
+            if future.exception():
+                failed[pair_key(futures[future])] = str(future.exception())
+
+    seconds = time.perf_counter() - st
+    sent = len(todo) - len(failed) - len(unconfirmed)
+    report = {
+        "round": round_id,
+        "pairs": len(pairs),
+        "sent": sent,
+        "skipped": len(pairs) - len(todo),
+        "failed": failed,
+        "unconfirmed": unconfirmed,
+        "seconds": round(seconds, 2),
+        "per_second": round(sent / seconds, 2) if seconds else None
+    }
+    print(f"Coffee DMs: {report}")
+    return report
@@ -1,46 +1,21 @@
-from db import events, records
+from db import users, events, records, checkins, attendance, repo
 from utils import EventInfo, send_message
-from typing import List
 from datetime import datetime as dt
-from .user import check_admin, register_user
-import random
+from .user import register_user
+from .codes import CodeAllocator
+from response_cache import response_cache
+from pubsub import hub
 
+CREATE_ATTEMPTS = 5
+# cached routes whose responses change when an event or check-in does
+EVENT_ROUTES = ("/events", "/admin/events", "/users/")
+CHECKIN_ROUTES = ("/admin/events", "/admin/leaderboard", "/users/")
 
-def handle_event(event: EventInfo, text: List[str]):
-    """
-    Handle event subcommands.
-    Args:
-        event (EventInfo): EventInfo object describing the event
-        text (List[str]): List of parsed words in the command
-    Returns:
-        Error 400 or HTTP 200 OK
-    """
-    if len(text) == 1:
-        return "Error: No subcommand provided", 400
-    
-    subcommand = text[1].lower()
-
-    if subcommand == "checkin":
-        if len(text) < 3:
-            send_message(event, body="Please provide an event code.", error=True)
-            return "Error: No code provided", 200
-        event_checkin(event, text[2].strip())
-
-    if subcommand == "create":
-        if len(text) < 3:
-            send_message(event, body="Please provide an event name.", error=True)
-            return "Error: No name provided", 200
-        
-        event_create(event, text[2])
-
-    if subcommand == "open" or subcommand == "close":
-        if len(text) < 3:
-            send_message(event, body="Please provide an event code.", error=True)
-            return "Error: No code provided", 200
-        
-        event_toggle(event, text[2].strip(), subcommand)
+codes = CodeAllocator(events)
+
+# check-ins only show up in records once the journal is flushed
+attendance.on_flush(lambda items: response_cache.invalidate(*CHECKIN_ROUTES))
 
-    return "HTTP 200 OK", 200
 
 def event_checkin(event: EventInfo, code: str):
     """
@@ -50,7 +25,19 @@ def event_checkin(event: EventInfo, code: str):
         code (str): The event code
     """
     user_id = event.user
-    event_info_momentum = events.get(code)
+    key = f"{code}{user_id}"
+    # None until we know whether the user has a record
+    checked_in = True if checkins.contains(code, user_id) else None
+    event_info_momentum = events.peek(code)
+
+    if event_info_momentum is None and checked_in is None:
+        # the event and the user's record are independent, read them at once
+        event_info_momentum, record = repo.gather(repo.events.get(code), repo.records.get(key))
+        if event_info_momentum is not None:
+            events.prime(code, event_info_momentum)
+        checked_in = record is not None
+    elif event_info_momentum is None:
+        event_info_momentum = events.get(code)
 
     if event_info_momentum == None:
         send_message(event, 
@@ -68,25 +55,44 @@ def event_checkin(event: EventInfo, code: str):
     
     n = event_info_momentum['name']
 
-    # check if user already checked in
-    if records.get(f"{code}{user_id}"):
+    # check if user already checked in, locally first; claiming the check-in
+    # in the index also stops a concurrent duplicate (e.g. a double tap) from
+    # being counted twice
+    if checked_in or (checked_in is None and records.get(key)) or not checkins.add(code, user_id):
+        checkins.add(code, user_id)
         send_message(event, 
                      body=f'You have already checked in to the event "{n}".')
         return "User already checked in", 200
     
-    # register user if not already registered
-    register_user(event, send_msg=False)
-
-    records.put(
-        {
-            "user": user_id, 
-            "event": code, 
-            "time": dt.now().timestamp()
-        }, 
-        f"{code}{user_id}")
+    # release the claim if the check-in can't be recorded, so a retry isn't
+    # told the user already checked in
+    checkin_time = dt.now().timestamp()
+    try:
+        # register user if not already registered
+        register_user(event, send_msg=False)
+        attendance.write(
+            {
+                "user": user_id, 
+                "event": code, 
+                "time": checkin_time
+            }, 
+            key)
+    except Exception:
+        checkins.discard(code, user_id)
+        raise
     send_message(event, 
                  header="Congrats!", 
                  body=f'You have successfully checked in to the event "{n}".')
+
+    # the attendance counters are updated when the journal is flushed
+    name = None
+    try:
+        user = users.get(user_id)
+        name = user.get('name') if user else None
+    except Exception as e:
+        print(f"Could not look up {user_id}: {e!r}")
+    response_cache.invalidate(*CHECKIN_ROUTES)
+    hub.publish(f"event:{code}", {"event": code, "user": user_id, "name": name, "time": checkin_time})
     
     return "HTTP 200 OK", 200
 
@@ -100,35 +106,30 @@ def event_create(event: EventInfo, name: str):
     """
     user_id = event.user
 
-    # check if user is an admin
-    if not check_admin(user_id):
-        send_message(event, 
-                     header="Admin access required", 
-                     body="You must be an admin to create events.", 
-                     error=True)
-        return "Error: User not admin", 400
-    
-    # generate new event code from random line in codes.txt
-    with open('codes.txt') as f:
-        codes = f.readlines()
-        code = random.choice(codes).strip()
-
-    try: 
-        events.insert(
-            {
-                "name": name, 
-                "created_by": user_id, 
-                "created_at": dt.now().timestamp(),
-                "open": False
-            }, code)
-    except Exception as e:
-        send_message(
-            event, 
-            header="Error creating event",
-            body="Sorry, an error occurred while creating the event. Try again.", 
-            error=True)
-        return "Error: Event creation failed", 400
+    # take an unused event code; another instance of the bot may have used
+    # it in the meantime, in which case insert fails and we take the next one
+    for attempt in range(CREATE_ATTEMPTS):
+        code = codes.allocate()
+        try: 
+            events.insert(
+                {
+                    "name": name, 
+                    "created_by": user_id, 
+                    "created_at": dt.now().timestamp(),
+                    "open": False
+                }, code)
+            break
+        except Exception as e:
+            if "already exists" in str(e) and attempt < CREATE_ATTEMPTS - 1:
+                continue
+            send_message(
+                event, 
+                header="Error creating event",
+                body="Sorry, an error occurred while creating the event. Try again.", 
+                error=True)
+            return "Error: Event creation failed", 400
     
+    response_cache.invalidate(*EVENT_ROUTES)
     send_message(event, 
                  header="Congrats!", 
                  body=f'You have successfully created the event "{name}". Checkin using code `{code}`.')
@@ -142,16 +143,6 @@ def event_toggle(event: EventInfo, code: str, subcommand: str):
         code (str): The event code
         subcommand (str): Either "open" or "close"
     """
-    user_id = event.user
-
-    # check if user is an admin
-    if not check_admin(user_id):
-        send_message(event, 
-                     header="Admin access required", 
-                     body="You must be an admin to open/close events.", 
-                     error=True)
-        return "Error: User not admin", 400
-    
     event_info_momentum = events.get(code)
 
     if event_info_momentum == None:
@@ -166,6 +157,7 @@ def event_toggle(event: EventInfo, code: str, subcommand: str):
 
     if subcommand == "open":
         events.update({"open": True}, code)
+        response_cache.invalidate(*EVENT_ROUTES)
         send_message(event, 
                      header="Event opened",
                      body=f'Users can now check in to event "{name}".', 
@@ -174,6 +166,8 @@ def event_toggle(event: EventInfo, code: str, subcommand: str):
     
     if subcommand == "close":
         events.update({"open": False}, code)
+        checkins.drop(code)
+        response_cache.invalidate(*EVENT_ROUTES)
         send_message(event, 
                      header="Event closed",
                      body=f'Users can no longer check in to event "{name}".', 
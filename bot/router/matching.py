@@ -0,0 +1,150 @@
+from itertools import combinations
+from typing import List
+from db import iter_fetch, put_all
+import random
+import time
+
+GREEDY_WINDOW = 25 # candidates considered for each user in the greedy pass
+MAX_STALE_ROUNDS = 50 # local search rounds per group without an improvement
+
+
+class PairHistory:
+    """
+    How often each pair of users has been matched before, as a sparse
+    symmetric matrix: users are mapped to integer indexes and counts are
+    stored only for pairs that have met, keyed by `i << 32 | j` with i < j.
+    """
+
+    def __init__(self):
+        self.index = {} # user id -> matrix index
+        self.counts = {}
+
+    def _cell(self, a: str, b: str, create: bool = False):
+        for user in (a, b):
+            if user not in self.index:
+                if not create:
+                    return None
+                self.index[user] = len(self.index)
+        i, j = sorted((self.index[a], self.index[b]))
+        return i << 32 | j
+
+    def count(self, a: str, b: str) -> int:
+        cell = self._cell(a, b)
+        return self.counts.get(cell, 0) if cell is not None else 0
+
+    def cost(self, group: List[str]) -> int:
+        """Number of previous meetings between members of a group."""
+        return sum(self.count(a, b) for a, b in combinations(group, 2))
+
+    def record(self, groups: List[List[str]]) -> list:
+        """
+        Count a round of matches.
+        Returns:
+            list: (a, b, new count) for every pair in the round
+        """
+        changed = []
+        for group in groups:
+            for a, b in combinations(sorted(group), 2):
+                cell = self._cell(a, b, create=True)
+                self.counts[cell] = self.counts.get(cell, 0) + 1
+                changed.append((a, b, self.counts[cell]))
+        return changed
+
+    @classmethod
+    def load(cls, base) -> "PairHistory":
+        """Load the history stored in a Base by `save`."""
+        history = cls()
+        for item in iter_fetch(base, prefetch=True):
+            cell = history._cell(item["a"], item["b"], create=True)
+            history.counts[cell] = item["count"]
+        return history
+
+    def save(self, base, groups: List[List[str]]):
+        """Count a round of matches and write the changed pairs to a Base."""
+        items = [{"key": f"{a}:{b}", "a": a, "b": b, "count": n}
+                 for a, b, n in self.record(groups)]
+        put_all(base, items)
+
+
+def random_matching(users: List[str], history: PairHistory = None,
+                    budget: float = 0) -> List[List[str]]:
+    """
+    Make random pairs of users; if there is an odd number of users, the last
+    group has 3.
+    """
+    users = list(users)
+    random.shuffle(users)
+    pairs = []
+    while len(users) > 0:
+        if len(users) == 3:
+            pairs.append(users)
+            break
+        pairs.append(users[:2])
+        users = users[2:]
+    return pairs
+
+
+def history_matching(users: List[str], history: PairHistory,
+                     budget: float = 1) -> List[List[str]]:
+    """
+    Make pairs (and one group of 3 for an odd number of users) that repeat
+    as few previous matches as possible. A greedy pass pairs each user with
+    the least-met of a window of candidates, then a local search swaps
+    members between groups while that lowers the number of repeats, until
+    there are none left, no swap helps anymore or `budget` seconds are up.
+    """
+    deadline = time.monotonic() + budget
+    remaining = list(users)
+    random.shuffle(remaining)
+
+    groups = []
+    while len(remaining) > 3:
+        a = remaining.pop()
+        window = range(max(0, len(remaining) - GREEDY_WINDOW), len(remaining))
+        best = min(window, key=lambda i: history.count(a, remaining[i]))
+        groups.append([a, remaining.pop(best)])
+    if remaining:
+        groups.append(remaining)
+
+    if len(groups) < 2:
+        return groups
+
+    costs = [history.cost(group) for group in groups]
+    bad = [i for i, c in enumerate(costs) if c > 0]
+    stale = 0
+    while bad and stale < MAX_STALE_ROUNDS * len(groups) and time.monotonic() < deadline:
+        k = random.randrange(len(bad))
+        i = bad[k]
+        if costs[i] == 0:
+            bad[k] = bad[-1]
+            bad.pop()
+            continue
+        j = random.randrange(len(groups) - 1)
+        j += j >= i
+
+        # find the best single swap of members between groups i and j
+        best, best_delta = None, 0
+        for x in range(len(groups[i])):
+            for y in range(len(groups[j])):
+                gi, gj = list(groups[i]), list(groups[j])
+                gi[x], gj[y] = gj[y], gi[x]
+                ci, cj = history.cost(gi), history.cost(gj)
+                delta = ci + cj - costs[i] - costs[j]
+                if delta < best_delta:
+                    best, best_delta = (gi, gj, ci, cj), delta
+
+        if best is None:
+            stale += 1
+            continue
+        stale = 0
+        groups[i], groups[j], costs[i], costs[j] = best
+        if costs[j] > 0:
+            bad.append(j)
+
+    return groups
+
+
+MATCHERS = {
+    "random": random_matching,
+    "history": history_matching
+}
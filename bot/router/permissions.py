@@ -0,0 +1,30 @@
+from db import users
+from db.cache import TTLCache, MISS
+
+ROLES_CACHE_TTL = 300 # seconds
+
+roles_cache = TTLCache(ttl=ROLES_CACHE_TTL)
+# any write to a user (e.g. make_admin) drops their cached roles
+users.on_change(roles_cache.invalidate)
+
+
+def resolve_roles(user_id: str) -> frozenset:
+    """
+    Get the roles of a user: "member" for registered users, plus "admin" for
+    admins. Unregistered users have no roles.
+    Args:
+        user_id (str): Slack user ID
+    Returns:
+        frozenset: the user's roles
+    """
+    roles = roles_cache.get(user_id)
+    if roles is MISS:
+        user = users.get(user_id)
+        roles = set()
+        if user:
+            roles.add("member")
+            if user.get("admin") == True:
+                roles.add("admin")
+        roles = frozenset(roles)
+        roles_cache.set(user_id, roles)
+    return roles
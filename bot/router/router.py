@@ -1,26 +1,92 @@
 from utils import EventInfo, send_message, parse_command
-from .user import handle_user
-from .event import handle_event
-from .committee import handle_committee
+from functools import partial
+from typing import Callable, NamedTuple
+from .user import user_makeadmin, user_register
+from .event import event_checkin, event_create, event_toggle
+from .committee import committee_join
 from .help_text import help_text
-from .coffee import handle_coffee
+from .permissions import resolve_roles
+from .coffee import coffee_create, coffee_out, coffee_dms
+
+
+class Command(NamedTuple):
+    handler: Callable # called as handler(event, *args)
+    min_args: int = 0
+    max_args: int = 0 # extra words are ignored...
+    rest: bool = False # ...unless they should be joined into the last argument
+    usage: str = None # sent to the user if arguments are missing
+    role: str = None # role a user needs to run the command
+
+
+# verb -> subcommand -> command; the None subcommand takes the arguments
+# right after the verb
+COMMANDS = {
+    "user": {
+        "makeadmin": Command(user_makeadmin, 1, 1, usage="Please provide the admin password."),
+        "register": Command(user_register)
+    },
+    "event": {
+        "checkin": Command(event_checkin, 1, 1, usage="Please provide an event code."),
+        "create": Command(event_create, 1, 1, rest=True, usage="Please provide an event name.", role="admin"),
+        "open": Command(partial(event_toggle, subcommand="open"), 1, 1, 
+                        usage="Please provide an event code.", role="admin"),
+        "close": Command(partial(event_toggle, subcommand="close"), 1, 1, 
+                         usage="Please provide an event code.", role="admin")
+    },
+    "committee": {
+        None: Command(committee_join, 1, 1, usage="Please provide a committee name.")
+    },
+    "coffee": {
+        "create": Command(coffee_create, role="admin"),
+        "out": Command(coffee_out),
+        "dms": Command(coffee_dms, role="admin")
+    }
+}
+
+ALIASES = {
+    "users": "user",
+    "events": "event",
+    "committees": "committee"
+}
+
 
 def router(event: EventInfo):
     text = parse_command(event.text)
 
-    if 'user' in text[0].lower():
-        return handle_user(event, text)
-    
-    elif 'event' in text[0].lower():
-        return handle_event(event, text)
-    
-    # elif 'committee' in text[0].lower():
-    #     return handle_committee(event, text)
-
-    elif 'coffee' in text[0].lower():
-        return handle_coffee(event, text)
-    
-    else:
+    # ignore a leading @-mention of the bot
+    if text and text[0].startswith("<@"):
+        text = text[1:]
+
+    verb = text[0].lower() if text else None
+    subcommands = COMMANDS.get(ALIASES.get(verb, verb))
+    if subcommands is None:
         # send some helpful text
         send_message(event, body=help_text)
-        return "Error: invalid command", 400
\ No newline at end of file
+        return "Error: invalid command", 400
+
+    if None in subcommands:
+        command, args = subcommands[None], text[1:]
+    elif len(text) == 1:
+        return "Error: No subcommand provided", 400
+    else:
+        command, args = subcommands.get(text[1].lower()), text[2:]
+        if command is None:
+            send_message(event, body="Invalid subcommand.", error=True)
+            return "Error: Invalid subcommand", 400
+
+    # resolve the user's roles once and check them against the command's
+    if command.role and command.role not in resolve_roles(event.user):
+        send_message(event, 
+                     header="Admin access required" if command.role == "admin" else "Permission denied", 
+                     body="You do not have permission to use this command.", 
+                     error=True)
+        return "Error: Unauthorized", 400
+
+    if len(args) < command.min_args:
+        send_message(event, body=command.usage, error=True)
+        return "Error: Missing arguments", 200
+
+    if command.rest and len(args) > command.max_args:
+        args = args[:command.max_args - 1] + [" ".join(args[command.max_args - 1:])]
+
+    return command.handler(event, *args[:command.max_args])
@@ -1,41 +1,40 @@
-from db import users
+from db import users, emails
 from utils import EventInfo, send_message
-from typing import List
-import requests
+from outbox import outbox
+from slack_client import SlackError
+from concurrent.futures import TimeoutError as LookupTimeout
 import os
 
 
-def handle_user(event: EventInfo, text: List[str]):
+def user_makeadmin(event: EventInfo, password: str):
     """
-    Handle user subcommands.
+    Make the user an admin if they give the correct password.
     Args:
         event (EventInfo): EventInfo object describing the event
-        text (List[str]): List of parsed words in the command
-    Returns:
-        Error 400 or HTTP 200 OK
+        password (str): The admin password
     """
-
-    if len(text) == 1:
-        return "Error: No subcommand provided", 400
+    # without a configured password nobody can become an admin this way
+    admin_pw = os.getenv('ADMIN_PW')
+    if not admin_pw or password != admin_pw:
+        send_message(event, 
+                     header="Incorrect password", 
+                     body="Contact an admin for assistance.", 
+                     error=True)
+        return "Error: Incorrect password", 200
     
-    subcommand = text[1].lower()
-    if subcommand == "makeadmin":
+    # otherwise, correct password given
+    make_admin(event)
+    return "HTTP 200 OK", 200
 
-        if len(text) < 3 or text[2] != os.getenv('ADMIN_PW'):
-            send_message(event, 
-                         header="Incorrect password", 
-                         body="Contact an admin for assistance.", 
-                         error=True)
-            return "Error: Incorrect password", 200
-        
-        # otherwise, correct password given
-        make_admin(event)
-        return "HTTP 200 OK", 200
-    
-    if subcommand == "register":
-        register_user(event, send_msg=True)
-        return "HTTP 200 OK", 200
-        
+
+def user_register(event: EventInfo):
+    """
+    Register the user, replying with the outcome.
+    Args:
+        event (EventInfo): EventInfo object describing the event
+    """
+    register_user(event, send_msg=True)
+    return "HTTP 200 OK", 200
 
 
 def make_admin(event: EventInfo):
@@ -50,7 +49,11 @@ def make_admin(event: EventInfo):
     if user: # if the user exists, update their admin status
         users.update({"admin": True}, user_id)
     else: # if the user doesn't exist in the db, create a new user
-        user_info = get_user_info(user_id)
+        try:
+            user_info = get_user_info(user_id)
+        except (LookupTimeout, SlackError) as e:
+            print(f"Could not look up user {user_id}: {e!r}")
+            user_info = None
         if not user_info: # the user couldn't be found in the workspace
             send_message(event, 
                          header="Error: User not found", 
@@ -65,25 +68,13 @@ def make_admin(event: EventInfo):
                 "email": user_info.get('email')
             }, 
             user_id)
+        emails.set(user_info.get('email'), user_id)
     
     send_message(event,
                  header="Success!", 
                  body="You are now an admin! You can now create events using `event create <name>`.")        
 
 
-def check_admin(user_id: str):
-    """
-    Helper function to check if a user is an admin. Useful for commands that
-    require admin access.
-    Args:
-        user_id (str): Slack user ID
-    """
-    user = users.get(user_id)
-    if user.get('admin') == True:
-        return True
-    return False
-
-
 def get_user_info(user_id: str):
     """
     Get a user's info from Slack to put into a database.
@@ -94,16 +85,10 @@ def get_user_info(user_id: str):
             be found
     """
     data = {
-        "Content-Type": "application/json",
         "user": user_id
     }
-    headers = {
-        "Authorization": f"Bearer {os.getenv('SLACK_BOT_TOKEN')}"
-    }
-    user_info = requests.get("https://slack.com/api/users.profile.get", 
-                                params=data, 
-                                headers=headers)
-    user_info = user_info.json().get('profile')
+    user_info = outbox.call("users.profile.get", data)
+    user_info = user_info.get('profile')
     return user_info
 
 
@@ -125,7 +110,13 @@ def register_user(event: EventInfo, send_msg: bool = False):
                          body="You are already registered.")
         return None
     else: # if the user doesn't exist in the db, create a new user
-        user_info = get_user_info(user_id)
+        try:
+            user_info = get_user_info(user_id)
+        except (LookupTimeout, SlackError) as e:
+            # Slack is backed up; the caller (e.g. a check-in) goes on without
+            # registering rather than failing
+            print(f"Could not look up user {user_id}: {e!r}")
+            user_info = None
         if not user_info: # the user couldn't be found in the workspace
             if send_msg:
                 send_message(event, 
@@ -141,6 +132,7 @@ def register_user(event: EventInfo, send_msg: bool = False):
                 "email": user_info.get('email')
             }, 
             user_id)
+        emails.set(user_info.get('email'), user_id)
     
     if send_msg:
         send_message(event,
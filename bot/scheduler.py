@@ -0,0 +1,197 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from dotenv import load_dotenv
+from threading import Thread, Event, Lock
+from metrics import Histogram
+import time
+import os
+
+load_dotenv()
+
+SCHEDULE_TZ = ZoneInfo(os.getenv("SCHEDULE_TZ", "America/Chicago"))
+TICK = 30 # seconds between checks for due jobs
+
+
+class CronSpec:
+    """
+    A standard 5-field cron expression: minute, hour, day of month, month and
+    day of week (0 or 7 is Sunday). Fields accept `*`, numbers, ranges
+    (`1-5`), lists (`1,15`) and steps (`*/15`, `0-30/10`). As in cron, if both
+    day fields are restricted a day matching either of them matches.
+    """
+
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, spec: str):
+        fields = spec.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron spec needs 5 fields: {spec!r}")
+        self.spec = spec
+        self.minute, self.hour, self.day, self.month, self.weekday = (
+            self._parse(field, lo, hi) for field, (lo, hi) in zip(fields, self.RANGES))
+        if 7 in self.weekday:
+            self.weekday = (self.weekday - {7}) | {0}
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, lo: int, hi: int) -> set:
+        values = set()
+        for part in field.split(","):
+            part, _, step = part.partition("/")
+            if part == "*":
+                start, end = lo, hi
+            elif "-" in part:
+                start, end = map(int, part.split("-"))
+            else:
+                start = end = int(part)
+                if step:
+                    end = hi
+            if not lo <= start <= end <= hi:
+                raise ValueError(f"Cron field out of range: {field!r}")
+            values.update(range(start, end + 1, int(step or 1)))
+        return values
+
+    def _day_matches(self, t: datetime) -> bool:
+        day = t.day in self.day
+        weekday = (t.isoweekday() % 7) in self.weekday
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, t: datetime) -> datetime:
+        """Returns the first matching minute strictly after `t`."""
+        t = t.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 4)
+        while t < limit:
+            if t.month not in self.month or not self._day_matches(t):
+                t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+            elif t.hour not in self.hour:
+                t = (t + timedelta(hours=1)).replace(minute=0)
+            elif t.minute not in self.minute:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"Cron spec never matches: {self.spec!r}")
+
+
+class Job:
+    """
+    A scheduled job.
+    Args:
+        name (str): unique job name, also the key of its persisted state
+        spec (str): cron expression for when the job runs
+        fn (callable): the job, called without arguments
+        misfire_grace (float): seconds a run may be late and still happen
+        catch_up (bool): whether a run missed by more than the grace time
+            (e.g. while the bot was down) still happens once on startup
+    """
+
+    def __init__(self, name: str, spec: str, fn, misfire_grace: float = 300, catch_up: bool = False):
+        self.name = name
+        self.cron = CronSpec(spec)
+        self.fn = fn
+        self.misfire_grace = misfire_grace
+        self.catch_up = catch_up
+        self.next_run = None
+        self.last_run = None
+        self.runtime = Histogram()
+        self.failures = 0
+
+
+class Scheduler:
+    """
+    Runs jobs on cron schedules in a background thread. Each job's last and
+    next run times are persisted in a Base, so runs missed while the bot was
+    down are caught up (or skipped) according to the job's misfire rules.
+    Only run the scheduler in one instance of the bot.
+    Args:
+        base (deta.Base): where job state is kept, keyed by job name
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.jobs = {}
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+
+    def add(self, name: str, spec: str, fn, **kwargs) -> Job:
+        job = Job(name, spec, fn, **kwargs)
+        with self._lock:
+            self.jobs[name] = job
+        return job
+
+    def start(self):
+        now = datetime.now(SCHEDULE_TZ)
+        for job in self.jobs.values():
+            try:
+                state = self.base.get(job.name) or {}
+            except Exception as e:
+                # don't keep the app from starting, schedule from now instead
+                print(f"Scheduler: could not load state of {job.name}: {e!r}")
+                state = {}
+            job.last_run = state.get("last_run")
+            next_run = state.get("next_run")
+            if next_run is None or state.get("spec") != job.cron.spec:
+                job.next_run = job.cron.next_after(now)
+            else:
+                job.next_run = datetime.fromtimestamp(next_run, SCHEDULE_TZ)
+                missed_by = (now - job.next_run).total_seconds()
+                if missed_by > job.misfire_grace and not job.catch_up:
+                    print(f"Scheduler: skipping missed run of {job.name} at {job.next_run}")
+                    job.next_run = job.cron.next_after(now)
+            self._save(job)
+
+        self._thread = Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            now = datetime.now(SCHEDULE_TZ)
+            for job in list(self.jobs.values()):
+                if job.next_run <= now:
+                    self.run(job)
+            self._stopped.wait(TICK)
+
+    def run(self, job: Job):
+        """Run a job now and schedule its next run."""
+        print(f"Scheduler: running {job.name}")
+        st = time.perf_counter()
+        try:
+            job.fn()
+        except Exception as e:
+            job.failures += 1
+            print(f"Scheduler: {job.name} failed: {e!r}")
+        finally:
+            job.runtime.observe(time.perf_counter() - st)
+            now = datetime.now(SCHEDULE_TZ)
+            job.last_run = now.timestamp()
+            # a run covers every missed occurrence, don't fire once per miss
+            job.next_run = job.cron.next_after(now)
+            self._save(job)
+
+    def _save(self, job: Job):
+        try:
+            self.base.put({
+                "spec": job.cron.spec,
+                "last_run": job.last_run,
+                "next_run": job.next_run.timestamp()
+            }, job.name)
+        except Exception as e:
+            print(f"Scheduler: could not save state of {job.name}: {e!r}")
+
+    def metrics(self) -> dict:
+        return {
+            job.name: {
+                "spec": job.cron.spec,
+                "next_run": job.next_run.isoformat() if job.next_run else None,
+                "last_run": job.last_run,
+                "failures": job.failures,
+                "runtime": job.runtime.snapshot()
+            }
+            for job in self.jobs.values()
+        }
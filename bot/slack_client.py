@@ -0,0 +1,107 @@
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from collections import defaultdict
+from metrics import Summary
+import requests
+import time
+import os
+
+load_dotenv()
+
+SLACK_API_URL = os.getenv("SLACK_API_URL", "https://slack.com/api")
+SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
+
+# (connect, read) timeouts in seconds per Web API method
+DEFAULT_TIMEOUT = (3, 10)
+TIMEOUTS = {
+    "chat.postEphemeral": (3, 5),
+    "chat.postMessage": (3, 10),
+    "conversations.members": (3, 10),
+    "users.profile.get": (3, 5)
+}
+
+
+class SlackError(Exception):
+    """Raised when a Slack Web API call could not be completed."""
+
+
+class RateLimited(SlackError):
+    """Raised when Slack answers a call with HTTP 429."""
+
+    def __init__(self, method: str, retry_after: float):
+        super().__init__(f"{method} rate limited, retry after {retry_after}s")
+        self.method = method
+        self.retry_after = retry_after
+
+
+class SlackClient:
+    """
+    Thin Slack Web API client that keeps one pooled, keep-alive session and
+    the bot token for the lifetime of the process.
+    Args:
+        token (str): Slack bot token
+        base_url (str): Web API root; point this at a fake server for tests
+        session (requests.Session): transport to use instead of the default
+            pooled session, e.g. one with custom adapters mounted
+        pool_size (int): number of connections kept alive to Slack
+    """
+
+    def __init__(self,
+                 token: str = SLACK_BOT_TOKEN,
+                 base_url: str = SLACK_API_URL,
+                 session: requests.Session = None,
+                 pool_size: int = 10):
+        self.token = token
+        self.base_url = base_url.rstrip("/")
+        self.session = session or self._make_session(pool_size)
+        self.latency = defaultdict(Summary)
+
+    @staticmethod
+    def _make_session(pool_size: int) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def api_call(self, method: str, json: dict = None, params: dict = None) -> dict:
+        """
+        Call a Slack Web API method. Calls with a json body are POSTed,
+        everything else is sent as a GET with query parameters.
+        Args:
+            method (str): Web API method, e.g. "chat.postMessage"
+            json (dict): JSON body of the call
+            params (dict): query parameters of the call
+        Returns:
+            dict: the decoded Slack response (check its "ok" field)
+        Raises:
+            RateLimited: if Slack answered with HTTP 429
+            SlackError: if the request failed or the response wasn't JSON
+        """
+        st = time.monotonic()
+        try:
+            r = self.session.request(
+                "POST" if json is not None else "GET",
+                f"{self.base_url}/{method}",
+                json=json,
+                params=params,
+                headers={"Authorization": f"Bearer {self.token}"},
+                timeout=TIMEOUTS.get(method, DEFAULT_TIMEOUT))
+        except requests.RequestException as e:
+            raise SlackError(f"{method} failed: {e}") from e
+        finally:
+            self.latency[method].observe(time.monotonic() - st)
+
+        if r.status_code == 429:
+            raise RateLimited(method, float(r.headers.get("Retry-After", 1)))
+
+        try:
+            return r.json()
+        except ValueError as e:
+            raise SlackError(f"{method} returned HTTP {r.status_code}") from e
+
+    def metrics(self) -> dict:
+        return {method: s.snapshot() for method, s in self.latency.items()}
+
+
+client = SlackClient()
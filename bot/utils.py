@@ -1,8 +1,8 @@
 from pydantic import BaseModel
-import requests
+from outbox import outbox
 import random
+import re
 from dotenv import load_dotenv
-import os
 
 load_dotenv()
 
@@ -15,6 +15,8 @@ class SlackEvent(BaseModel):
     token: str = None
     type: str = None
     challenge: str = None
+    event_id: str = None
+    event_time: int = None
     event: EventInfo = None
 
 def send_message(event: EventInfo, 
@@ -51,42 +53,49 @@ def send_message(event: EventInfo,
 
     # send message
     data = {
-        "Content-Type": "application/json",
-        "token": os.getenv('SLACK_BOT_TOKEN'),
         "channel": event.channel,
         "user": event.user,
         "text": message
     }
-    r = requests.post("https://slack.com/api/chat.postEphemeral", data=data)
-    print(r.text)
+    outbox.enqueue("chat.postEphemeral", data)
+
+QUOTES = '"“”„'
+QUOTE_RE = re.compile(f"[{QUOTES}]")
 
 def parse_command(text: str):
     """
-    Parses a command from the text of a Slack message. Text inside quotes is
-    treated as a single argument.
+    Parses a command from the text of a Slack message. Text inside quotes
+    (straight or smart) is treated as a single argument, and joins any text
+    it touches into one word; an unterminated quote runs to the end of the
+    text, less trailing whitespace.
     Args:
         text (str): Text of the Slack message
     Returns:
-        command (str): The command, i.e. the first word of the message
-        args (list): The arguments to the command, i.e. the rest of the message
+        args (list): The words of the message, i.e. the command followed by
+            its arguments
     """
-    text = text.replace(u"“", '"').replace(u"”", '"')
-    # split by spaces
-    words = text.split()
+    text = text or ""
+    # most commands have no quotes, and are simply split on whitespace
+    if not QUOTE_RE.search(text):
+        return text.split()
 
-    # parse words in quotes
+    # split at the quotes: odd pieces are inside quotes, even ones outside
+    pieces = QUOTE_RE.split(text.rstrip())
+    last = len(pieces) - 1
     args = []
-    in_quote = False
-    for word in words:
-        if word[0] == '"' and word[-1] != '"':
-            in_quote = True
-            args.append(word[1:])
-        elif word[-1] == '"' and word[0] != '"':
-            in_quote = False
-            args[-1] += " " + word[:-1]
-        elif in_quote:
-            args[-1] += " " + word
-        else:
-            args.append(word)
+    glue = False # the next piece continues the last argument
+    for i, piece in enumerate(pieces):
+        if i % 2:
+            if glue:
+                args[-1] += piece
+            elif piece or i < last: # keep "" but not a lone trailing quote
+                args.append(piece)
+                glue = True
+        elif piece:
+            words = piece.split()
+            if glue and not piece[0].isspace():
+                args[-1] += words.pop(0)
+            args.extend(words)
+            glue = not piece[-1].isspace()
     
-    return args
\ No newline at end of file
+    return args